@@ -0,0 +1,299 @@
+"""
+Sales analytics rollups.
+
+Paid orders are folded into hourly and daily buckets in `sales_rollups`:
+revenue, order count, units, plus per product, per category and per culture
+breakdowns. The dashboard reads a handful of bucket documents instead of
+scanning orders.
+
+- Live: an 'analytics.order_paid' outbox message (enqueued with the payment
+  update) applies $inc's to the order's hour and day buckets. The order's
+  `analytics_recorded_at` flag is set right before, so retries never count
+  twice; with MONGO_TRANSACTIONS=true both writes share a transaction.
+- Backfill: ANALYTICS_BACKFILL_INTERVAL seconds apart, the last
+  ANALYTICS_BACKFILL_DAYS days are recomputed from orders with aggregation
+  pipelines and replace the live buckets, repairing anything the live path
+  missed. `python analytics.py --days N` rebuilds a longer range.
+
+Bucket times are UTC and keyed by paid_at.
+"""
+import asyncio
+import logging
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from database import get_database, disconnect
+from outbox import outbox_handler
+from payments import MONGO_TRANSACTIONS
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_BACKFILL_INTERVAL = float(os.getenv('ANALYTICS_BACKFILL_INTERVAL', '3600'))
+ANALYTICS_BACKFILL_DAYS = int(os.getenv('ANALYTICS_BACKFILL_DAYS', '2'))
+# Paid orders the live path hasn't picked up within this long are left to the backfill
+ANALYTICS_GRACE_SECONDS = int(os.getenv('ANALYTICS_GRACE_SECONDS', '300'))
+
+GRANULARITIES = ('hour', 'day')
+BREAKDOWNS = ('products', 'categories', 'cultures')
+UNKNOWN = 'unknown'
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def bucket_id(granularity: str, start: datetime) -> str:
+    return f"{granularity}:{start.strftime('%Y-%m-%dT%H')}"
+
+def _key(name: Optional[str]) -> str:
+    """Breakdown keys are field names: no dots, no leading $"""
+    name = (name or UNKNOWN).replace('.', '_')
+    return '_' + name[1:] if name.startswith('$') else name
+
+def _order_increments(order: dict) -> dict:
+    inc = defaultdict(int)
+    inc['orders'] = 1
+    inc['revenue'] = order.get('total', 0)
+    inc['subtotal'] = order.get('subtotal', 0)
+    inc['delivery_fees'] = order.get('delivery_fee', 0)
+    for item in order.get('items', []):
+        units = item.get('quantity', 0)
+        revenue = item.get('price', 0) * units
+        inc['units'] += units
+        for breakdown, name in (
+            ('products', item.get('product_id')),
+            ('categories', item.get('category')),
+            ('cultures', item.get('culture'))
+        ):
+            inc[f'{breakdown}.{_key(name)}.units'] += units
+            inc[f'{breakdown}.{_key(name)}.revenue'] += revenue
+    return dict(inc)
+
+async def _fill_item_details(db, items: List[dict]):
+    """Look up category/culture for order lines recorded before they were stored on items"""
+    missing = {item['product_id'] for item in items if not item.get('category') or not item.get('culture')}
+    if not missing:
+        return
+    products = {}
+    async for product in db.products.find(
+        {'product_id': {'$in': list(missing)}}, {'_id': 0, 'product_id': 1, 'category': 1, 'culture': 1}
+    ):
+        products[product['product_id']] = product
+    for item in items:
+        product = products.get(item['product_id'], {})
+        item['category'] = item.get('category') or product.get('category')
+        item['culture'] = item.get('culture') or product.get('culture')
+
+async def _claim_and_count(db, order: dict, session=None) -> bool:
+    """Flag the order as recorded and $inc its buckets, back to back"""
+    now = datetime.utcnow()
+    claimed = await db.orders.update_one(
+        {'order_id': order['order_id'], 'analytics_recorded_at': {'$exists': False}},
+        {'$set': {'analytics_recorded_at': now}},
+        session=session
+    )
+    if not claimed.modified_count:
+        return False
+    paid_at = order.get('paid_at') or order.get('created_at') or now
+    inc = _order_increments(order)
+    await db.sales_rollups.bulk_write([
+        UpdateOne(
+            {'_id': bucket_id(granularity, bucket_start(paid_at, granularity))},
+            {
+                '$inc': inc,
+                '$set': {'updated_at': now},
+                '$setOnInsert': {'granularity': granularity, 'bucket': bucket_start(paid_at, granularity)}
+            },
+            upsert=True
+        )
+        for granularity in GRANULARITIES
+    ], ordered=False, session=session)
+    return True
+
+async def record_paid_order(db, order_id: str) -> bool:
+    """Add a paid order to its hour and day buckets (at most once per order)"""
+    order = await db.orders.find_one(
+        {'order_id': order_id, 'payment_status': 'paid', 'analytics_recorded_at': {'$exists': False}},
+        {'_id': 0, 'order_id': 1, 'paid_at': 1, 'created_at': 1, 'total': 1, 'subtotal': 1, 'delivery_fee': 1, 'items': 1}
+    )
+    if order is None:
+        return False
+    # Look up item details before claiming: a rebuild that runs between the claim
+    # and the $inc would count the order and then see the $inc add it again
+    await _fill_item_details(db, order.get('items', []))
+    if not MONGO_TRANSACTIONS:
+        return await _claim_and_count(db, order)
+
+    async with await db.client.start_session() as session:
+        async def run(s):
+            return await _claim_and_count(db, order, session=s)
+        return await session.with_transaction(run)
+
+@outbox_handler('analytics.order_paid')
+async def record_paid_order_handler(db, payload: dict):
+    await record_paid_order(db, payload['order_id'])
+
+# ---- backfill ----
+
+def _empty_bucket(granularity: str, start: datetime) -> dict:
+    return {
+        '_id': bucket_id(granularity, start),
+        'granularity': granularity,
+        'bucket': start,
+        'orders': 0,
+        'revenue': 0.0,
+        'subtotal': 0.0,
+        'delivery_fees': 0.0,
+        'units': 0,
+        **{breakdown: {} for breakdown in BREAKDOWNS}
+    }
+
+def _add(bucket: dict, breakdown: str, name: Optional[str], units: int, revenue: float):
+    entry = bucket[breakdown].setdefault(_key(name), {'units': 0, 'revenue': 0.0})
+    entry['units'] += units
+    entry['revenue'] += revenue
+
+async def rebuild_rollups(db, start: datetime, end: Optional[datetime] = None) -> int:
+    """Recompute all buckets from `start` (floored to a day) to now; returns buckets written"""
+    now = datetime.utcnow()
+    start = bucket_start(start, 'day')
+    end = end or now
+
+    # Claim paid orders the live path never recorded so a late handler can't count them again
+    await db.orders.update_many(
+        {
+            'payment_status': 'paid',
+            'paid_at': {'$gte': start, '$lt': now - timedelta(seconds=ANALYTICS_GRACE_SECONDS)},
+            'analytics_recorded_at': {'$exists': False}
+        },
+        {'$set': {'analytics_recorded_at': now}}
+    )
+
+    # Only recorded orders: an unclaimed one inside the grace period is still
+    # pending in the live path, which will $inc it onto the rebuilt bucket
+    match = {'$match': {
+        'payment_status': 'paid',
+        'paid_at': {'$gte': start, '$lt': end},
+        'analytics_recorded_at': {'$exists': True}
+    }}
+    hour = {'$dateTrunc': {'date': '$paid_at', 'unit': 'hour'}}
+    buckets: Dict[str, dict] = {}
+
+    def buckets_for(moment: datetime):
+        for granularity in GRANULARITIES:
+            begin = bucket_start(moment, granularity)
+            key = bucket_id(granularity, begin)
+            if key not in buckets:
+                buckets[key] = _empty_bucket(granularity, begin)
+            yield buckets[key]
+
+    async for row in db.orders.aggregate([
+        match,
+        {'$group': {
+            '_id': hour,
+            'orders': {'$sum': 1},
+            'revenue': {'$sum': '$total'},
+            'subtotal': {'$sum': '$subtotal'},
+            'delivery_fees': {'$sum': '$delivery_fee'}
+        }}
+    ]):
+        for bucket in buckets_for(row['_id']):
+            for field in ('orders', 'revenue', 'subtotal', 'delivery_fees'):
+                bucket[field] += row[field]
+
+    lines = await db.orders.aggregate([
+        match,
+        {'$unwind': '$items'},
+        {'$group': {
+            '_id': {
+                'hour': hour,
+                'product_id': '$items.product_id',
+                'category': '$items.category',
+                'culture': '$items.culture'
+            },
+            'units': {'$sum': '$items.quantity'},
+            'revenue': {'$sum': {'$multiply': ['$items.price', '$items.quantity']}}
+        }}
+    ]).to_list(length=None)
+    items = [dict(row['_id']) for row in lines]
+    await _fill_item_details(db, items)
+    for row, item in zip(lines, items):
+        for bucket in buckets_for(item['hour']):
+            bucket['units'] += row['units']
+            _add(bucket, 'products', item['product_id'], row['units'], row['revenue'])
+            _add(bucket, 'categories', item.get('category'), row['units'], row['revenue'])
+            _add(bucket, 'cultures', item.get('culture'), row['units'], row['revenue'])
+
+    requests = []
+    for bucket in buckets.values():
+        bucket['updated_at'] = now
+        requests.append(ReplaceOne({'_id': bucket['_id']}, bucket, upsert=True))
+    # Buckets in the range that no longer have paid orders
+    requests.append(DeleteMany({'bucket': {'$gte': start, '$lt': end}, '_id': {'$nin': list(buckets)}}))
+    await db.sales_rollups.bulk_write(requests, ordered=False)
+    return len(buckets)
+
+async def backfill_recent(db) -> int:
+    return await rebuild_rollups(db, datetime.utcnow() - timedelta(days=ANALYTICS_BACKFILL_DAYS))
+
+# ---- dashboard ----
+
+def _top(entries: Dict[str, dict], limit: int) -> List[dict]:
+    ranked = sorted(entries.items(), key=lambda kv: kv[1]['revenue'], reverse=True)[:limit]
+    return [{'name': name, 'units': e['units'], 'revenue': round(e['revenue'], 2)} for name, e in ranked]
+
+async def sales_summary(db, granularity: str, start: datetime, end: datetime, top: int = 10) -> dict:
+    """Series and breakdown totals for [start, end) read from pre-aggregated buckets"""
+    docs = await db.sales_rollups.find(
+        {'granularity': granularity, 'bucket': {'$gte': bucket_start(start, granularity), '$lt': end}},
+        {'_id': 0, 'granularity': 0, 'updated_at': 0}
+    ).sort('bucket', 1).to_list(length=None)
+
+    totals = {'orders': 0, 'revenue': 0.0, 'subtotal': 0.0, 'delivery_fees': 0.0, 'units': 0}
+    breakdowns = {breakdown: {} for breakdown in BREAKDOWNS}
+    series = []
+    for doc in docs:
+        for field in totals:
+            totals[field] += doc.get(field, 0)
+        for breakdown in BREAKDOWNS:
+            for name, entry in doc.get(breakdown, {}).items():
+                total = breakdowns[breakdown].setdefault(name, {'units': 0, 'revenue': 0.0})
+                total['units'] += entry.get('units', 0)
+                total['revenue'] += entry.get('revenue', 0)
+        series.append({
+            'bucket': doc['bucket'],
+            'orders': doc.get('orders', 0),
+            'revenue': round(doc.get('revenue', 0), 2),
+            'units': doc.get('units', 0)
+        })
+    for field in ('revenue', 'subtotal', 'delivery_fees'):
+        totals[field] = round(totals[field], 2)
+    return {
+        'granularity': granularity,
+        'start': start,
+        'end': end,
+        'totals': totals,
+        'series': series,
+        'by_culture': _top(breakdowns['cultures'], len(breakdowns['cultures'])),
+        'by_category': _top(breakdowns['categories'], len(breakdowns['categories'])),
+        'top_products': _top(breakdowns['products'], top)
+    }
+
+async def main(days: int) -> int:
+    db = get_database(
+        mongo_url=os.getenv('MONGO_URL', 'mongodb://localhost:27017'),
+        db_name=os.getenv('DB_NAME', 'test_database')
+    )
+    written = await rebuild_rollups(db, datetime.utcnow() - timedelta(days=days))
+    print(f'✅ Rebuilt {written} sales rollup buckets covering {days} days')
+    await disconnect()
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = sys.argv[1:]
+    days = int(args[args.index('--days') + 1]) if '--days' in args else ANALYTICS_BACKFILL_DAYS
+    sys.exit(asyncio.run(main(days)))
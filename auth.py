@@ -2,18 +2,51 @@ from fastapi import HTTPException, Header, Cookie, Request
 from typing import Optional
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import bcrypt
 import os
+from cachetools import TTLCache
 from models import User, UserSession
+from cache import invalidation_bus
+from metrics import track
 
 # JWT Configuration
 JWT_SECRET = os.getenv('JWT_SECRET', 'afrolatino_secret_key_12345')
 JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', '10080'))  # 7 days
 
+# Embed is_admin/email/name in new tokens so requests can authorize without a
+# user lookup. Claims are only trusted for JWT_CLAIMS_MAX_AGE seconds after
+# issue; older tokens fall back to the principal cache / database. Tokens are
+# not reissued, so only requests in the first JWT_CLAIMS_MAX_AGE seconds after
+# login skip the lookup; after that each worker does at most one user read
+# per user every PRINCIPAL_CACHE_TTL seconds.
+JWT_EMBED_CLAIMS = os.getenv('JWT_EMBED_CLAIMS', 'false').lower() == 'true'
+JWT_CLAIMS_MAX_AGE = int(os.getenv('JWT_CLAIMS_MAX_AGE', '300'))
+
+# Short-lived cache of authenticated users keyed by user_id
+PRINCIPAL_CACHE_TTL = int(os.getenv('PRINCIPAL_CACHE_TTL', '30'))
+PRINCIPAL_CACHE_SIZE = int(os.getenv('PRINCIPAL_CACHE_SIZE', '10000'))
+_principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+invalidation_bus.subscribe('users', _principal_cache.clear)
+
+# bcrypt cost factor for new hashes; existing hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+
+# bcrypt runs on a dedicated thread pool (it releases the GIL) so hashing
+# never blocks the event loop. Jobs beyond PASSWORD_HASH_MAX_QUEUE waiting
+# are rejected with a 503 instead of piling up.
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', '64'))
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='bcrypt')
+_hash_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+password_hash_stats = {'queued': 0, 'in_flight': 0, 'completed': 0, 'rejected': 0}
+
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -21,32 +54,127 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
-def create_access_token(user_id: str) -> str:
-    """Create a JWT token"""
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+def needs_rehash(hashed_password: str) -> bool:
+    """True if a hash was made with a different cost factor than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed_password.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+async def _run_password_job(func, *args):
+    if password_hash_stats['queued'] >= PASSWORD_HASH_MAX_QUEUE:
+        password_hash_stats['rejected'] += 1
+        raise HTTPException(status_code=503, detail='Server busy, please retry')
+    password_hash_stats['queued'] += 1
+    try:
+        await _hash_slots.acquire()
+    finally:
+        password_hash_stats['queued'] -= 1
+    password_hash_stats['in_flight'] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        password_hash_stats['in_flight'] -= 1
+        password_hash_stats['completed'] += 1
+        _hash_slots.release()
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the bcrypt worker pool"""
+    with track('auth'):
+        return await _run_password_job(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the bcrypt worker pool"""
+    with track('auth'):
+        return await _run_password_job(verify_password, plain_password, hashed_password)
+
+def shutdown_password_pool():
+    """Wait for in-flight hashing jobs and stop the worker threads"""
+    _hash_executor.shutdown(wait=True)
+
+def create_access_token(user_id: str, user: Optional[User] = None) -> str:
+    """Create a JWT token (with authorization claims if JWT_EMBED_CLAIMS is on)"""
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = {
         'user_id': user_id,
         'exp': expire
     }
+    if JWT_EMBED_CLAIMS and user is not None:
+        to_encode.update({
+            'iat': now,
+            'email': user.email,
+            'name': user.name,
+            'is_admin': user.is_admin
+        })
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> str:
-    """Verify JWT token and return user_id"""
+def is_jwt(token: str) -> bool:
+    """JWTs are three dot-separated segments; Google OAuth session tokens are opaque"""
+    return token.count('.') == 2
+
+def decode_token(token: str) -> dict:
+    """Verify JWT token and return its payload"""
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id: str = payload.get('user_id')
-        if user_id is None:
-            raise HTTPException(status_code=401, detail='Invalid authentication')
-        return user_id
     except JWTError:
         raise HTTPException(status_code=401, detail='Invalid authentication')
+    if payload.get('user_id') is None:
+        raise HTTPException(status_code=401, detail='Invalid authentication')
+    return payload
+
+def verify_token(token: str) -> str:
+    """Verify JWT token and return user_id"""
+    return decode_token(token)['user_id']
 
-async def get_current_user(db, authorization: Optional[str] = Header(None), session_token: Optional[str] = Cookie(None)):
+def _user_from_claims(payload: dict) -> Optional[User]:
+    """Build a lightweight User from fresh embedded claims, if present"""
+    if not JWT_EMBED_CLAIMS or 'is_admin' not in payload or 'iat' not in payload:
+        return None
+    issued_at = datetime.fromtimestamp(payload['iat'], timezone.utc)
+    if datetime.now(timezone.utc) - issued_at > timedelta(seconds=JWT_CLAIMS_MAX_AGE):
+        return None
+    # Claims were validated when the token was signed; skip re-validation
+    return User.model_construct(
+        user_id=payload['user_id'],
+        email=payload.get('email'),
+        name=payload.get('name'),
+        is_admin=bool(payload['is_admin'])
+    )
+
+def invalidate_user(user_id: str):
+    """Drop a user from this worker's principal cache"""
+    _principal_cache.pop(user_id, None)
+
+async def load_user(db, user_id: str) -> User:
+    """Get a user through the principal cache"""
+    user = _principal_cache.get(user_id)
+    if user is None:
+        user_doc = await db.users.find_one({'user_id': user_id}, {'_id': 0})
+        if not user_doc:
+            raise HTTPException(status_code=401, detail='User not found')
+        user = User(**user_doc)
+        _principal_cache[user_id] = user
+    return user
+
+async def get_current_user(
+    db,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Cookie(None),
+    allow_claims: bool = True
+):
     """
     Get current user from JWT token or session token
     Tries: 1) Cookie session_token, 2) Authorization header
+    With allow_claims, fresh embedded token claims are used without a lookup;
+    pass allow_claims=False when the full profile is needed.
     """
+    with track('auth'):
+        return await _resolve_user(db, authorization, session_token, allow_claims)
+
+async def _resolve_user(db, authorization: Optional[str], session_token: Optional[str], allow_claims: bool):
     token = None
     
     # Try cookie first
@@ -59,9 +187,9 @@ async def get_current_user(db, authorization: Optional[str] = Header(None), sess
     if not token:
         raise HTTPException(status_code=401, detail='Not authenticated')
     
-    # Check if it's a session token or JWT
-    # Session tokens from Google OAuth are longer
-    if len(token) > 200:
+    # Check if it's a session token or JWT (by structure: tokens with embedded
+    # claims are as long as Google OAuth session tokens)
+    if not is_jwt(token):
         # This is a session token from Google OAuth
         session = await db.user_sessions.find_one({'session_token': token}, {'_id': 0})
         if not session:
@@ -79,14 +207,15 @@ async def get_current_user(db, authorization: Optional[str] = Header(None), sess
         user_id = session['user_id']
     else:
         # This is a JWT token
-        user_id = verify_token(token)
+        payload = decode_token(token)
+        user_id = payload['user_id']
+        if allow_claims:
+            user = _user_from_claims(payload)
+            if user is not None:
+                return user
     
     # Get user
-    user = await db.users.find_one({'user_id': user_id}, {'_id': 0})
-    if not user:
-        raise HTTPException(status_code=401, detail='User not found')
-    
-    return User(**user)
+    return await load_user(db, user_id)
 
 async def get_current_admin(db, authorization: Optional[str] = Header(None), session_token: Optional[str] = Cookie(None)):
     """Get current user and verify admin status"""
@@ -0,0 +1,134 @@
+"""
+Checkout-burst benchmark for order repricing.
+
+A burst of concurrent carts is repriced against a fake products collection
+that sleeps --latency ms per query to stand in for a Mongo round trip.
+Three strategies are compared:
+
+- per-line: one find_one per order line (what batching replaces)
+- cold: reprice_cart with an empty product cache, one $in query per cart
+- warm: reprice_cart with the product cache already filled
+
+price_order_items is also timed on its own (pure CPU, no I/O).
+
+    python benchmarks/checkout.py [--carts N] [--lines N] [--latency MS]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import product_cache, price_order_items, reprice_cart, CHECKOUT_PROJECTION
+from models import OrderItem
+
+CATALOG_SIZE = 500
+
+class _Cursor:
+    def __init__(self, docs: list, latency: float):
+        self._docs = docs
+        self._latency = latency
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await asyncio.sleep(self._latency)
+        for doc in self._docs:
+            yield doc
+
+class _Products:
+    def __init__(self, docs: dict, latency: float):
+        self.docs = docs
+        self.latency = latency
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        ids = query['product_id']['$in']
+        return _Cursor([self._project(self.docs[pid]) for pid in ids if pid in self.docs], self.latency)
+
+    async def find_one(self, query, projection=None):
+        self.queries += 1
+        await asyncio.sleep(self.latency)
+        doc = self.docs.get(query['product_id'])
+        return self._project(doc) if doc else None
+
+    @staticmethod
+    def _project(doc: dict) -> dict:
+        return {field: doc[field] for field in CHECKOUT_PROJECTION if field in doc}
+
+class _Database:
+    def __init__(self, latency: float):
+        docs = {
+            f'prod-{n:04d}': {
+                'product_id': f'prod-{n:04d}', 'name': f'Product {n}', 'price': round(1 + n * 0.37, 2),
+                'image': f'https://example.com/{n}.jpg', 'in_stock': True,
+                'category': 'Spices', 'culture': 'African', 'description': 'x' * 200
+            }
+            for n in range(CATALOG_SIZE)
+        }
+        self.products = _Products(docs, latency)
+
+def _carts(db: _Database, carts: int, lines: int) -> list:
+    rng = random.Random(42)
+    ids = list(db.products.docs)
+    return [
+        [
+            OrderItem(product_id=pid, name='', price=db.products.docs[pid]['price'], quantity=rng.randint(1, 4), image='')
+            for pid in rng.sample(ids, lines)
+        ]
+        for _ in range(carts)
+    ]
+
+async def _per_line(db, items):
+    products = {}
+    for item in items:
+        product = await db.products.find_one({'product_id': item.product_id}, CHECKOUT_PROJECTION)
+        if product:
+            products[item.product_id] = product
+    return price_order_items(items, products)
+
+async def _burst(db: _Database, carts: list, strategy: str) -> tuple:
+    if strategy != 'warm':
+        product_cache.clear()
+    db.products.queries = 0
+    started = time.perf_counter()
+    if strategy == 'per-line':
+        await asyncio.gather(*(_per_line(db, items) for items in carts))
+    elif strategy == 'cold':
+        # Each cart misses: clear before every lookup so no cart benefits from another
+        async def cold(items):
+            product_cache.clear()
+            return await reprice_cart(db, items)
+        await asyncio.gather(*(cold(items) for items in carts))
+    else:
+        await asyncio.gather(*(reprice_cart(db, items) for items in carts))
+    return time.perf_counter() - started, db.products.queries
+
+def main(carts: int, lines: int, latency_ms: float):
+    db = _Database(latency_ms / 1000)
+    burst = _carts(db, carts, lines)
+    print(f"{carts} concurrent carts x {lines} lines, {latency_ms} ms per query")
+    print(f"{'strategy':<10}{'queries':>9}{'burst ms':>11}{'per cart ms':>13}")
+    for strategy in ('per-line', 'cold', 'warm'):
+        if strategy == 'warm':
+            asyncio.run(_burst(db, burst, 'fill'))
+        elapsed, queries = asyncio.run(_burst(db, burst, strategy))
+        print(f"{strategy:<10}{queries:>9}{elapsed * 1000:>11.1f}{elapsed * 1000 / carts:>13.3f}")
+
+    products = {pid: _Products._project(doc) for pid, doc in db.products.docs.items()}
+    number = 200
+    best = min(timeit.repeat(lambda: price_order_items(burst[0], products), number=number, repeat=5))
+    print(f"price_order_items: {best / number * 1e6:.1f} µs per {lines}-line cart")
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+
+    def arg(name: str, default):
+        return type(default)(args[args.index(name) + 1]) if name in args else default
+
+    main(arg('--carts', 200), arg('--lines', 20), arg('--latency', 1.0))
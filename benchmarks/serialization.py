@@ -0,0 +1,54 @@
+"""
+Serialization benchmark: FastJSONResponse (orjson) against FastAPI's default
+jsonable_encoder + JSONResponse, for a 20-product page and a 100-recipe list
+built from the seed data.
+
+    python benchmarks/serialization.py [--number N]
+"""
+import os
+import sys
+import timeit
+from copy import deepcopy
+from itertools import cycle, islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from responses import FastJSONResponse
+from seed_data import mock_products, mock_recipes
+
+def _documents(seed: list, count: int, id_field: str) -> list:
+    docs = [deepcopy(doc) for doc in islice(cycle(seed), count)]
+    for n, doc in enumerate(docs):
+        doc[id_field] = f'{id_field}-{n:04d}'
+    return docs
+
+PAYLOADS = {
+    '20 products': {
+        'products': _documents(mock_products, 20, 'product_id'),
+        'total': 240, 'page': 1, 'pages': 12, 'next_cursor': None, 'prev_cursor': None
+    },
+    '100 recipes': {'recipes': _documents(mock_recipes, 100, 'recipe_id')}
+}
+
+def _fast(payload: dict) -> bytes:
+    return FastJSONResponse(payload).body
+
+def _default(payload: dict) -> bytes:
+    return JSONResponse(jsonable_encoder(payload)).body
+
+def main(number: int):
+    print(f"{'payload':<14}{'bytes':>9}{'default µs':>13}{'orjson µs':>12}{'speedup':>10}")
+    for name, payload in PAYLOADS.items():
+        timings = {}
+        for label, render in (('default', _default), ('fast', _fast)):
+            best = min(timeit.repeat(lambda: render(payload), number=number, repeat=5))
+            timings[label] = best / number * 1e6
+        size = len(_fast(payload))
+        print(f"{name:<14}{size:>9}{timings['default']:>13.1f}{timings['fast']:>12.1f}"
+              f"{timings['default'] / timings['fast']:>9.1f}x")
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[args.index('--number') + 1]) if '--number' in args else 200)
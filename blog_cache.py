@@ -0,0 +1,80 @@
+"""
+Blog read path caching.
+
+- List views project away the post `content`; they only need the excerpt.
+- Full posts are kept in a bounded LRU keyed by (post_id, updated_at), so an
+  edit naturally misses the cache. A small validator read (updated_at, views)
+  decides whether the cached body is current.
+- slug -> post_id lookups hit an in-memory table that is rebuilt when posts
+  are created or edited (and lazily on other workers after invalidation).
+"""
+import os
+import re
+from typing import Dict, Optional
+from cachetools import LRUCache
+from cache import invalidation_bus
+
+BLOG_POST_CACHE_SIZE = int(os.getenv('BLOG_POST_CACHE_SIZE', '256'))
+EXCERPT_LENGTH = 200
+
+BLOG_LIST_PROJECTION = {'_id': 0, 'content': 0}
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_MARKDOWN_RE = re.compile(r'[#*_`>\[\]!]+|\(https?://[^)]*\)')
+
+def make_excerpt(content: str, length: int = EXCERPT_LENGTH) -> str:
+    """Plain-text excerpt of a post body, cut at a word boundary"""
+    text = _MARKDOWN_RE.sub('', _TAG_RE.sub(' ', content or ''))
+    text = ' '.join(text.split())
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(' ', 1)[0].rstrip('.,;:') + '…'
+
+class BlogPostCache:
+    """Rendered post bodies plus the slug lookup table"""
+
+    def __init__(self, maxsize: int = BLOG_POST_CACHE_SIZE):
+        self._bodies = LRUCache(maxsize=maxsize)
+        self._slugs: Dict[str, str] = {}
+        self._slugs_loaded = False
+
+    async def rebuild_slugs(self, db):
+        slugs = {}
+        async for doc in db.blog_posts.find({}, {'_id': 0, 'slug': 1, 'post_id': 1}):
+            if doc.get('slug'):
+                slugs[doc['slug']] = doc['post_id']
+        self._slugs = slugs
+        self._slugs_loaded = True
+
+    def clear_slugs(self):
+        self._slugs_loaded = False
+
+    async def post_id_for_slug(self, db, slug: str) -> Optional[str]:
+        if not self._slugs_loaded:
+            await self.rebuild_slugs(db)
+        post_id = self._slugs.get(slug)
+        if post_id is None:
+            # Possibly created on another worker since our last rebuild
+            doc = await db.blog_posts.find_one({'slug': slug}, {'_id': 0, 'post_id': 1})
+            if doc:
+                post_id = self._slugs[slug] = doc['post_id']
+        return post_id
+
+    async def get_post(self, db, post_id: str) -> Optional[dict]:
+        """Full post with a live view count, body served from the LRU when current"""
+        head = await db.blog_posts.find_one({'post_id': post_id}, {'_id': 0, 'updated_at': 1, 'views': 1})
+        if head is None:
+            return None
+        key = (post_id, head.get('updated_at'))
+        body = self._bodies.get(key)
+        if body is None:
+            body = await db.blog_posts.find_one({'post_id': post_id}, {'_id': 0, 'views': 0})
+            if body is None:
+                return None
+            self._bodies[key] = body
+        post = dict(body)
+        post['views'] = head.get('views', 0)
+        return post
+
+blog_post_cache = BlogPostCache()
+invalidation_bus.subscribe('blog_posts', blog_post_cache.clear_slugs)
@@ -0,0 +1,127 @@
+"""
+In-process caching with cross-worker invalidation.
+
+Each worker keeps its own TTL/size-bounded caches. Admin writes call
+invalidate(), which clears the local namespaces immediately and bumps their
+version counters, fields of a single `cache_versions` document, in one
+write; every worker polls that document (one small query every
+CACHE_SYNC_INTERVAL seconds) and clears namespaces whose version moved.
+"""
+import logging
+import os
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable
+from cachetools import TTLCache
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+CACHE_SYNC_INTERVAL = float(os.getenv('CACHE_SYNC_INTERVAL', '2'))
+# The cache_versions document holding one counter field per namespace
+VERSIONS_ID = 'namespaces'
+REFERENCE_CACHE_SIZE = int(os.getenv('REFERENCE_CACHE_SIZE', '256'))
+
+# Seconds each reference-data namespace may be served from memory
+REFERENCE_CACHE_TTLS = {
+    'categories': 300,
+    'regions': 3600,
+    'testimonials': 3600,
+    'settings': 300,
+    'announcements': 120,
+    'notices': 60,
+}
+
+class InvalidationBus:
+    """Namespace version counters shared by all workers through MongoDB"""
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._synced = False
+        self._handlers: Dict[str, list] = defaultdict(list)
+
+    def subscribe(self, namespace: str, handler: Callable[[], None]):
+        """Register a callback run whenever `namespace` is invalidated"""
+        self._handlers[namespace].append(handler)
+
+    def _notify(self, namespace: str):
+        for handler in self._handlers.get(namespace, []):
+            handler()
+
+    async def publish(self, db, namespaces: Iterable[str], skip_local: Iterable[str] = ()):
+        """
+        Invalidate namespaces on every worker with one $inc. Namespaces in
+        skip_local are not cleared here: this worker has already brought its
+        own copy up to date.
+        """
+        namespaces = list(dict.fromkeys(namespaces))
+        skip_local = set(skip_local)
+        for namespace in namespaces:
+            if namespace not in skip_local:
+                self._notify(namespace)
+        doc = await db.cache_versions.find_one_and_update(
+            {'_id': VERSIONS_ID},
+            {'$inc': {namespace: 1 for namespace in namespaces}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        for namespace in namespaces:
+            # A namespace missing after a poll was at version 0
+            known = self._versions.get(namespace, 0 if self._synced else None)
+            if namespace in skip_local and known is not None and doc[namespace] > known + 1:
+                # Another worker bumped it since our last poll; that invalidation still applies here
+                self._notify(namespace)
+            self._versions[namespace] = doc[namespace]
+
+    async def poll(self, db):
+        """Apply invalidations published by other workers"""
+        doc = await db.cache_versions.find_one({'_id': VERSIONS_ID}) or {}
+        for namespace, version in doc.items():
+            if namespace == '_id':
+                continue
+            known = self._versions.get(namespace)
+            self._versions[namespace] = version
+            # After the first poll, a namespace appearing for the first time has been invalidated too
+            if known != version and (known is not None or self._synced):
+                self._notify(namespace)
+        self._synced = True
+
+class ReferenceCache:
+    """Per-namespace TTL caches for rarely-changing reference data"""
+
+    def __init__(self, bus: InvalidationBus, ttls: Dict[str, int], maxsize: int = REFERENCE_CACHE_SIZE):
+        self._caches = {
+            namespace: TTLCache(maxsize=maxsize, ttl=ttl)
+            for namespace, ttl in ttls.items()
+        }
+        for namespace in self._caches:
+            bus.subscribe(namespace, self._caches[namespace].clear)
+
+    async def get_or_load(self, namespace: str, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        """Return the cached value for (namespace, key), loading it on a miss"""
+        cache = self._caches[namespace]
+        value = cache.get(key)
+        if value is None:
+            value = await loader()
+            cache[key] = value
+        return value
+
+    def clear(self):
+        for cache in self._caches.values():
+            cache.clear()
+
+invalidation_bus = InvalidationBus()
+reference_cache = ReferenceCache(invalidation_bus, REFERENCE_CACHE_TTLS)
+
+async def invalidate(db, *namespaces: str, local: bool = True, skip_local: Iterable[str] = ()):
+    """
+    Invalidate cached data for the given namespaces on all workers in one
+    write. Pass local=False (or list namespaces in skip_local) for caches
+    this worker has already updated itself.
+    """
+    if not namespaces:
+        return
+    try:
+        await invalidation_bus.publish(db, namespaces, skip_local=namespaces if not local else skip_local)
+    except Exception as e:
+        # Local copies are already cleared; other workers fall back to TTL expiry
+        logger.error(f"Cache invalidation for {', '.join(namespaces)} not published: {e}")
@@ -0,0 +1,97 @@
+"""Product lookups for checkout: a short-lived cache in front of batched $in queries"""
+import os
+from typing import Dict, Iterable, List, Tuple
+from cachetools import TTLCache
+from fastapi import HTTPException
+from cache import invalidation_bus
+from models import OrderItem
+
+PRODUCT_CACHE_TTL = int(os.getenv('PRODUCT_CACHE_TTL', '30'))
+PRODUCT_CACHE_SIZE = int(os.getenv('PRODUCT_CACHE_SIZE', '20000'))
+
+# Only the fields checkout needs
+CHECKOUT_PROJECTION = {
+    '_id': 0,
+    'product_id': 1,
+    'name': 1,
+    'price': 1,
+    'image': 1,
+    'in_stock': 1,
+    'category': 1,
+    'culture': 1
+}
+
+# Client prices within half a cent of the catalog price are accepted
+PRICE_TOLERANCE = 0.005
+
+class ProductCache:
+    """Checkout view of products keyed by product_id"""
+
+    def __init__(self, maxsize: int = PRODUCT_CACHE_SIZE, ttl: int = PRODUCT_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get_many(self, db, product_ids: Iterable[str]) -> Dict[str, dict]:
+        """Return cached products, loading all misses in a single $in query"""
+        wanted = set(product_ids)
+        found = {pid: self._cache[pid] for pid in wanted if pid in self._cache}
+        missing = wanted - found.keys()
+        if missing:
+            cursor = db.products.find({'product_id': {'$in': list(missing)}}, CHECKOUT_PROJECTION)
+            async for product in cursor:
+                self._cache[product['product_id']] = product
+                found[product['product_id']] = product
+        return found
+
+    def invalidate(self, product_id: str):
+        self._cache.pop(product_id, None)
+
+    def clear(self):
+        self._cache.clear()
+
+product_cache = ProductCache()
+invalidation_bus.subscribe('products', product_cache.clear)
+
+def price_order_items(items: List[OrderItem], products: Dict[str, dict]) -> Tuple[List[OrderItem], list]:
+    """
+    Reprice order lines from the catalog. Returns the repriced lines and a
+    list of problems (unknown product, out of stock, changed price, bad quantity).
+    """
+    priced, problems = [], []
+    for item in items:
+        product = products.get(item.product_id)
+        if product is None:
+            problems.append({'product_id': item.product_id, 'problem': 'not_found'})
+            continue
+        if item.quantity <= 0:
+            problems.append({'product_id': item.product_id, 'problem': 'invalid_quantity'})
+            continue
+        if not product.get('in_stock', True):
+            problems.append({'product_id': item.product_id, 'problem': 'out_of_stock'})
+            continue
+        if abs(item.price - product['price']) > PRICE_TOLERANCE:
+            problems.append({
+                'product_id': item.product_id,
+                'problem': 'price_changed',
+                'price': product['price']
+            })
+            continue
+        priced.append(OrderItem(
+            product_id=item.product_id,
+            name=product['name'],
+            price=product['price'],
+            quantity=item.quantity,
+            image=product['image'],
+            category=product.get('category'),
+            culture=product.get('culture')
+        ))
+    return priced, problems
+
+async def reprice_cart(db, items: List[OrderItem]) -> List[OrderItem]:
+    """Validate a cart against the catalog, raising 409 if it is stale"""
+    if not items:
+        raise HTTPException(status_code=400, detail="Order has no items")
+    products = await product_cache.get_many(db, (item.product_id for item in items))
+    priced, problems = price_order_items(items, products)
+    if problems:
+        raise HTTPException(status_code=409, detail={'message': 'Cart is out of date', 'problems': problems})
+    return priced
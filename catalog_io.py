@@ -0,0 +1,228 @@
+"""
+Bulk catalog import and export.
+
+Imports read an NDJSON or CSV request body as a stream, validate rows
+against the Product model in batches of IMPORT_BATCH_SIZE and write each
+batch with one unordered bulk_write of upserts keyed on product_id, which
+every row must carry. Fields present in a row are $set; model defaults for
+absent fields only apply when the product is new. Facet and category counts are adjusted once per batch
+from the before/after versions of every product the batch wrote.
+
+CSV files have a header row with Product field names; `images` holds
+'|'-separated URLs and empty cells mean "not provided". Row numbers in the
+error report are physical line numbers (the CSV header is row 1).
+
+Exports stream the catalog back out in the same formats.
+"""
+import csv
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import orjson
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from models import Product
+from facets import facet_changes, merge_changes, apply_facet_changes, FACET_PROJECTION
+from streaming import stream_documents, FORMATS, LIST_SEPARATOR, EXPORT_BATCH_SIZE
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+# Cap the error report so a wholly broken file doesn't produce a huge response
+MAX_REPORTED_ERRORS = 1000
+
+PRODUCT_FIELDS = list(Product.model_fields)
+
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    """Import/export format from an explicit `format` or the Content-Type"""
+    if requested:
+        return requested if requested in FORMATS else None
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return None
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """Numbered text lines from a byte stream"""
+    buffer = b''
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *complete, buffer = buffer.split(b'\n')
+        for raw in complete:
+            number += 1
+            yield number, raw.decode('utf-8-sig' if number == 1 else 'utf-8').rstrip('\r')
+    if buffer:
+        number += 1
+        yield number, buffer.decode('utf-8-sig' if number == 1 else 'utf-8').rstrip('\r')
+
+async def _ndjson_rows(chunks) -> AsyncIterator[Tuple[int, object]]:
+    async for number, line in _lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            yield number, orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield number, ValueError(f"Invalid JSON: {e}")
+
+def _csv_cell(name: str, value: str):
+    if name == 'images':
+        return [url.strip() for url in value.split(LIST_SEPARATOR) if url.strip()]
+    return value
+
+async def _csv_rows(chunks) -> AsyncIterator[Tuple[int, object]]:
+    header = None
+    pending, start = None, 0
+    async for number, line in _lines(chunks):
+        # A quoted cell may span lines; a record is complete once its quotes balance
+        if pending is None:
+            pending, start = line, number
+        else:
+            pending += '\n' + line
+        if pending.count('"') % 2:
+            continue
+        record, pending = pending, None
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) > len(header):
+            yield start, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        yield start, {name: _csv_cell(name, value) for name, value in zip(header, values) if value != ''}
+    if pending is not None:
+        yield start, ValueError("Unterminated quoted field")
+
+def _upsert(row: dict, now: datetime) -> Tuple[dict, dict, UpdateOne]:
+    """
+    Validate a row and build its upsert (raises ValidationError/ValueError).
+    Rows must carry a product_id: without one the model would generate a
+    fresh id, so re-importing the same file would duplicate the product.
+    Returns the document as inserted if new, the fields $set if it exists,
+    and the operation.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Row must be an object")
+    if not row.get('product_id'):
+        raise ValueError("Missing product_id")
+    product = Product(**row)
+    doc = product.dict()
+    provided = set(product.model_fields_set) - {'product_id', 'created_at', 'updated_at'}
+    if 'stock_quantity' in provided and product.stock_quantity is not None:
+        doc['in_stock'] = product.stock_quantity > 0
+        provided.add('in_stock')
+    doc['updated_at'] = now
+    to_set = {name: doc[name] for name in provided}
+    to_set['updated_at'] = now
+    on_insert = {name: value for name, value in doc.items() if name not in to_set}
+    return doc, to_set, UpdateOne({'product_id': product.product_id}, {'$set': to_set, '$setOnInsert': on_insert}, upsert=True)
+
+def _format_validation_error(e: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+
+class ImportReport:
+    """
+    Running totals and per-row errors for one import. Every received row ends
+    up inserted, updated, failed or superseded (a later row in the same batch
+    had the same product_id and was written instead).
+    """
+
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.superseded = 0
+        self.errors: List[dict] = []
+        self.superseded_rows: List[dict] = []
+
+    def error(self, row: int, messages: List[str], product_id: Optional[str] = None):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'product_id': product_id, 'errors': messages})
+
+    def supersede(self, row: int, by_row: int, product_id: str):
+        self.superseded += 1
+        if len(self.superseded_rows) < MAX_REPORTED_ERRORS:
+            self.superseded_rows.append({'row': row, 'product_id': product_id, 'superseded_by': by_row})
+
+    def dict(self) -> dict:
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'failed': self.failed,
+            'superseded': self.superseded,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'superseded_rows': self.superseded_rows
+        }
+
+async def _write_batch(db, batch: Dict[str, Tuple[int, dict, dict, UpdateOne]], report: ImportReport):
+    product_ids = list(batch)
+    # Current facet values of products that already exist, to count what they leave
+    existing = {}
+    async for doc in db.products.find({'product_id': {'$in': product_ids}}, {**FACET_PROJECTION, 'product_id': 1}):
+        existing[doc['product_id']] = doc
+
+    entries = list(batch.values())
+    failed = set()
+    try:
+        result = await db.products.bulk_write([op for _, _, _, op in entries], ordered=False)
+        report.inserted += result.upserted_count
+        report.updated += result.matched_count
+    except BulkWriteError as e:
+        details = e.details
+        report.inserted += details.get('nUpserted', 0)
+        report.updated += details.get('nMatched', 0)
+        for error in details.get('writeErrors', []):
+            index = error['index']
+            failed.add(index)
+            report.error(entries[index][0], [error.get('errmsg', 'Write failed')], product_ids[index])
+
+    changes = []
+    for index, (product_id, (_, doc, to_set, _)) in enumerate(zip(product_ids, entries)):
+        if index in failed:
+            continue
+        before = existing.get(product_id)
+        changes.append(facet_changes(before, {**before, **to_set} if before else doc))
+    await apply_facet_changes(db, merge_changes(*changes))
+
+async def import_products(db, chunks: AsyncIterator[bytes], fmt: str, batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    """Validate and upsert a streamed NDJSON/CSV upload batch by batch"""
+    report = ImportReport()
+    rows = _csv_rows(chunks) if fmt == 'csv' else _ndjson_rows(chunks)
+    now = datetime.utcnow()
+    # product_id -> (row number, new document, $set fields, upsert); a later row for the same id supersedes an earlier one
+    batch: Dict[str, Tuple[int, dict, dict, UpdateOne]] = {}
+    async for number, row in rows:
+        report.received += 1
+        if isinstance(row, Exception):
+            report.error(number, [str(row)])
+            continue
+        try:
+            doc, to_set, op = _upsert(row, now)
+        except ValidationError as e:
+            report.error(number, _format_validation_error(e), row.get('product_id'))
+            continue
+        except ValueError as e:
+            report.error(number, [str(e)])
+            continue
+        product_id = doc['product_id']
+        if product_id in batch:
+            report.supersede(batch[product_id][0], number, product_id)
+        batch[product_id] = (number, doc, to_set, op)
+        if len(batch) >= batch_size:
+            await _write_batch(db, batch, report)
+            batch = {}
+    if batch:
+        await _write_batch(db, batch, report)
+    return report
+
+def export_products(db, fmt: str, query: Optional[dict] = None, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Stream products as NDJSON or CSV, one chunk per cursor batch"""
+    cursor = db.products.find(query or {}, {'_id': 0}).sort('product_id', 1)
+    return stream_documents(cursor, fmt, PRODUCT_FIELDS, batch_size=batch_size)
@@ -0,0 +1,148 @@
+"""
+Response compression.
+
+CompressionMiddleware negotiates brotli or gzip from Accept-Encoding and
+compresses complete JSON/text responses of at least COMPRESSION_MIN_SIZE
+bytes. Brotli is only offered when the `brotli` package is installed.
+
+Responses carrying an ETag (the cacheable catalog, recipe and blog routes)
+are compressed once and kept in a small LRU keyed by (ETag, encoding, body
+digest), so hot responses aren't recompressed on every hit. The digest keeps
+this correct for weak ETags that deliberately ignore volatile fields such
+as blog view counts.
+
+Streaming responses, already-encoded responses and small bodies pass
+through untouched.
+
+Configuration (environment):
+    COMPRESSION_MIN_SIZE      bytes, default 1024
+    COMPRESSION_GZIP_LEVEL    1-9, default 6
+    COMPRESSION_BROTLI_QUALITY 0-11, default 5
+    COMPRESSION_CACHE_SIZE    compressed bodies kept, default 256
+"""
+import gzip
+import hashlib
+import importlib.util
+import os
+from typing import List, Optional
+from cachetools import LRUCache
+from starlette.datastructures import Headers, MutableHeaders
+
+brotli = None
+if importlib.util.find_spec('brotli') is not None:
+    import brotli
+
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+COMPRESSION_CACHE_SIZE = int(os.getenv('COMPRESSION_CACHE_SIZE', '256'))
+
+compression_stats = {'compressed': 0, 'cache_hits': 0, 'passed_through': 0}
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/x-ndjson')
+
+def supported_encodings() -> List[str]:
+    """Encodings this process can produce, in order of preference"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the preferred supported encoding the client accepts (honouring q=0)"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in supported_encodings():
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+def _is_compressible(headers: Headers) -> bool:
+    if 'content-encoding' in headers:
+        return False
+    content_type = headers.get('content-type', '')
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def _is_cacheable(headers: Headers) -> bool:
+    cache_control = headers.get('cache-control', '').lower()
+    return 'etag' in headers and 'no-store' not in cache_control
+
+class CompressionMiddleware:
+    """ASGI middleware compressing buffered responses (see module docstring)"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, cache_size: int = COMPRESSION_CACHE_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = LRUCache(maxsize=cache_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message['type'] == 'http.response.start':
+                # Hold the headers until we know whether the body gets compressed
+                start_message = message
+                return
+            if message['type'] != 'http.response.body' or passthrough:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message['headers'])
+            body = message.get('body', b'')
+            if message.get('more_body', False) or not _is_compressible(headers):
+                # Streaming or binary/pre-encoded: forward as-is
+                passthrough = True
+                compression_stats['passed_through'] += 1
+                await send(start_message)
+                await send(message)
+                return
+
+            headers.add_vary_header('Accept-Encoding')
+            if len(body) < self.minimum_size:
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = None
+            key = None
+            if _is_cacheable(headers):
+                key = (headers['etag'], encoding, hashlib.blake2b(body, digest_size=16).digest())
+                compressed = self.cache.get(key)
+                if compressed is not None:
+                    compression_stats['cache_hits'] += 1
+            if compressed is None:
+                compressed = compress(body, encoding)
+                compression_stats['compressed'] += 1
+                if key is not None:
+                    self.cache[key] = compressed
+
+            headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(len(compressed))
+            await send(start_message)
+            await send({'type': 'http.response.body', 'body': compressed})
+
+        await self.app(scope, receive, send_wrapper)
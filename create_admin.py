@@ -1,15 +1,14 @@
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database, disconnect
 import os
 from datetime import datetime
 from auth import hash_password
 
 async def create_admin_user():
-    mongo_url = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
-    db_name = os.getenv('DB_NAME', 'test_database')
-    
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[db_name]
+    db = get_database(
+        mongo_url=os.getenv('MONGO_URL', 'mongodb://localhost:27017'),
+        db_name=os.getenv('DB_NAME', 'test_database')
+    )
     
     # Check if admin already exists
     existing_admin = await db.users.find_one({'email': 'admin@afrolatino.ca'})
@@ -17,7 +16,7 @@ async def create_admin_user():
     if existing_admin:
         print('⚠️  Admin user already exists!')
         print('   Email: admin@afrolatino.ca')
-        client.close()
+        await disconnect()
         return
     
     # Create admin user
@@ -69,7 +68,7 @@ async def create_admin_user():
         await db.site_settings.insert_one(default_settings)
         print('✅ Default site settings initialized')
     
-    client.close()
+    await disconnect()
 
 if __name__ == '__main__':
     asyncio.run(create_admin_user())
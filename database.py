@@ -0,0 +1,92 @@
+"""
+Shared MongoDB client.
+
+One pooled AsyncIOMotorClient per process, configured from the environment
+and used by the API and the CLI scripts alike:
+
+    MONGO_URL, DB_NAME
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_READ_PREFERENCE
+    MONGO_COMPRESSORS (comma-separated, e.g. 'zstd,snappy,zlib')
+"""
+import importlib.util
+import logging
+import os
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from metrics import MongoCommandListener
+
+logger = logging.getLogger(__name__)
+
+# Compressors that need an optional package to be installed
+_COMPRESSOR_PACKAGES = {'zstd': 'zstandard', 'snappy': 'snappy'}
+
+_client: Optional[AsyncIOMotorClient] = None
+_db_name: Optional[str] = None
+
+def _available_compressors(requested: str) -> list:
+    compressors = []
+    for name in filter(None, (c.strip() for c in requested.split(','))):
+        package = _COMPRESSOR_PACKAGES.get(name)
+        if package and importlib.util.find_spec(package) is None:
+            logger.warning(f"MongoDB compressor {name} requested but {package} is not installed")
+            continue
+        compressors.append(name)
+    return compressors
+
+def client_options() -> dict:
+    """Driver options read from the environment"""
+    options = {
+        'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', '100')),
+        'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', '5')),
+        'maxIdleTimeMS': int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '60000')),
+        'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        'readPreference': os.getenv('MONGO_READ_PREFERENCE', 'primary'),
+        # Per-command and per-request round-trip metrics (see metrics.py)
+        'event_listeners': [MongoCommandListener()],
+    }
+    compressors = _available_compressors(os.getenv('MONGO_COMPRESSORS', ''))
+    if compressors:
+        options['compressors'] = compressors
+    return options
+
+def get_client(mongo_url: Optional[str] = None) -> Optional[AsyncIOMotorClient]:
+    """Return the process-wide client, creating it on first use (None if not configured)"""
+    global _client
+    if _client is None:
+        mongo_url = mongo_url or os.getenv('MONGO_URL')
+        if not mongo_url:
+            return None
+        _client = AsyncIOMotorClient(mongo_url, **client_options())
+    return _client
+
+def get_database(mongo_url: Optional[str] = None, db_name: Optional[str] = None):
+    """Return the configured database (DB_NAME, else the database in MONGO_URL)"""
+    global _db_name
+    client = get_client(mongo_url)
+    if client is None:
+        return None
+    _db_name = db_name or _db_name or os.getenv('DB_NAME')
+    if _db_name:
+        return client[_db_name]
+    try:
+        return client.get_default_database()
+    except Exception:
+        # pymongo raises ConfigurationError when the URL names no database
+        return None
+
+async def connect():
+    """Warm up the pool: select a server and open a connection before traffic arrives"""
+    client = get_client()
+    if client is None:
+        return
+    await client.admin.command('ping')
+    logger.info("MongoDB connected")
+
+async def disconnect():
+    """Close the shared client and all pooled connections"""
+    global _client, _db_name
+    if _client is not None:
+        _client.close()
+        _client = None
+        _db_name = None
@@ -0,0 +1,171 @@
+"""
+Materialized facet counts for the catalog filter sidebar.
+
+Product counts per value of every filter dimension (FACET_FIELDS) live in
+`facet_counts`, one document per (field, value). Product writes turn their
+before/after documents into deltas with facet_changes() and apply them,
+together with categories.product_count, via apply_facet_changes(), so all
+dimensions move together.
+
+verify_facets() recomputes every dimension from `products` in one $facet
+aggregation and reports (and with repair=True fixes) any drift, e.g. after a
+write that failed part-way. It runs every FACET_REPAIR_INTERVAL seconds and
+as `python facets.py [--check]`.
+
+facets_for_query() returns counts for an arbitrary product filter in a
+single $facet aggregation; unfiltered requests read the stored counts.
+"""
+import asyncio
+import logging
+import os
+import sys
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from database import get_database, disconnect
+from repository import adjust_category_counts
+
+logger = logging.getLogger(__name__)
+
+FACET_FIELDS = ('category', 'region', 'country', 'culture', 'in_stock', 'featured')
+FACET_PROJECTION = {'_id': 0, **{field: 1 for field in FACET_FIELDS}}
+FACET_REPAIR_INTERVAL = float(os.getenv('FACET_REPAIR_INTERVAL', '3600'))
+
+FacetKey = Tuple[str, object]
+
+def facet_id(field: str, value) -> str:
+    if isinstance(value, bool):
+        value = 'true' if value else 'false'
+    return f'{field}:{value}'
+
+def facet_changes(before: Optional[dict], after: Optional[dict]) -> Dict[FacetKey, int]:
+    """Count deltas per (field, value) for a product created, updated or deleted"""
+    changes = Counter()
+    for field in FACET_FIELDS:
+        if before is not None and before.get(field) is not None:
+            changes[(field, before[field])] -= 1
+        if after is not None and after.get(field) is not None:
+            changes[(field, after[field])] += 1
+    return {key: delta for key, delta in changes.items() if delta}
+
+def merge_changes(*changesets: Dict[FacetKey, int]) -> Dict[FacetKey, int]:
+    merged = Counter()
+    for changes in changesets:
+        merged.update(changes)
+    return {key: delta for key, delta in merged.items() if delta}
+
+async def apply_facet_changes(db, changes: Dict[FacetKey, int]):
+    """Apply facet deltas in one bulk_write, plus the matching category product_count deltas"""
+    if not changes:
+        return
+    await db.facet_counts.bulk_write([
+        UpdateOne(
+            {'_id': facet_id(field, value)},
+            {'$inc': {'count': delta}, '$setOnInsert': {'field': field, 'value': value}},
+            upsert=True
+        )
+        for (field, value), delta in changes.items()
+    ], ordered=False)
+    await adjust_category_counts(db, {value: delta for (field, value), delta in changes.items() if field == 'category'})
+
+def _facet_pipeline(query: dict) -> list:
+    return [
+        {'$match': query},
+        {'$facet': {
+            field: [
+                {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+                {'$match': {'_id': {'$ne': None}}},
+                {'$sort': {'count': -1, '_id': 1}}
+            ]
+            for field in FACET_FIELDS
+        }}
+    ]
+
+async def count_facets(db, query: dict) -> Dict[str, List[dict]]:
+    """Counts per value of every facet field for products matching `query`"""
+    result = await db.products.aggregate(_facet_pipeline(query)).to_list(length=1)
+    row = result[0] if result else {}
+    return {
+        field: [{'value': group['_id'], 'count': group['count']} for group in row.get(field, [])]
+        for field in FACET_FIELDS
+    }
+
+async def stored_facets(db) -> Dict[str, List[dict]]:
+    """The materialized counts for the whole catalog"""
+    facets = {field: [] for field in FACET_FIELDS}
+    async for doc in db.facet_counts.find({'count': {'$gt': 0}}, {'_id': 0}):
+        if doc.get('field') in facets:
+            facets[doc['field']].append({'value': doc['value'], 'count': doc['count']})
+    for groups in facets.values():
+        groups.sort(key=lambda group: (-group['count'], str(group['value'])))
+    return facets
+
+async def facets_for_query(db, query: dict) -> Dict[str, List[dict]]:
+    if not query:
+        return await stored_facets(db)
+    return await count_facets(db, query)
+
+async def verify_facets(db, repair: bool = False) -> List[dict]:
+    """
+    Compare stored facet and category counts with the products collection.
+    Returns the drift found; with repair=True the stored counts are corrected.
+    """
+    actual = await count_facets(db, {})
+    expected = {
+        facet_id(field, group['value']): (field, group['value'], group['count'])
+        for field, groups in actual.items() for group in groups
+    }
+    stored = {doc['_id']: doc.get('count', 0) async for doc in db.facet_counts.find({}, {'_id': 1, 'count': 1})}
+
+    drift = []
+    for key, (field, value, count) in expected.items():
+        if stored.get(key) != count:
+            drift.append({'facet': key, 'stored': stored.get(key), 'actual': count})
+    stale = [key for key, count in stored.items() if key not in expected and count != 0]
+    drift.extend({'facet': key, 'stored': stored[key], 'actual': 0} for key in stale)
+
+    category_counts = {group['value']: group['count'] for group in actual['category']}
+    category_drift = {}
+    async for category in db.categories.find({}, {'_id': 0, 'name': 1, 'product_count': 1}):
+        count = category_counts.get(category['name'], 0)
+        if category.get('product_count') != count:
+            category_drift[category['name']] = count
+            drift.append({'facet': f"categories.{category['name']}", 'stored': category.get('product_count'), 'actual': count})
+
+    if repair and drift:
+        requests = [
+            ReplaceOne({'_id': key}, {'_id': key, 'field': field, 'value': value, 'count': count}, upsert=True)
+            for key, (field, value, count) in expected.items() if stored.get(key) != count
+        ]
+        requests.append(DeleteMany({'_id': {'$nin': list(expected)}}))
+        await db.facet_counts.bulk_write(requests, ordered=False)
+        if category_drift:
+            await db.categories.bulk_write(
+                [UpdateOne({'name': name}, {'$set': {'product_count': count}}) for name, count in category_drift.items()],
+                ordered=False
+            )
+        logger.warning(f"Repaired {len(drift)} drifted facet counts")
+    return drift
+
+async def rebuild_facets(db) -> List[dict]:
+    """Recompute every stored count from scratch (e.g. after seeding)"""
+    return await verify_facets(db, repair=True)
+
+async def main(check_only: bool) -> int:
+    db = get_database(
+        mongo_url=os.getenv('MONGO_URL', 'mongodb://localhost:27017'),
+        db_name=os.getenv('DB_NAME', 'test_database')
+    )
+    drift = await verify_facets(db, repair=not check_only)
+    if drift:
+        print(f"⚠️  {len(drift)} facet counts {'drifted' if check_only else 'repaired'}:")
+        for item in drift:
+            print(f"   - {item['facet']}: stored {item['stored']}, actual {item['actual']}")
+    else:
+        print('✅ Facet counts match the catalog')
+    await disconnect()
+    return 1 if drift and check_only else 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main('--check' in sys.argv[1:])))
@@ -0,0 +1,211 @@
+"""
+Stripe payment gateway.
+
+One PaymentGateway lives for the whole app lifespan. It keeps a single
+keep-alive HTTP client for all Stripe calls, caches the API credentials read
+from site settings (invalidated by update_settings), applies per-call
+timeouts and trips a circuit breaker when Stripe keeps failing.
+Set STRIPE_API_BASE to point it at a local fake Stripe server (e.g. stripe-mock).
+"""
+import json
+import logging
+import os
+import time
+from calendar import timegm
+from datetime import datetime
+from typing import Dict, Optional
+import stripe
+from fastapi import HTTPException
+from pydantic import BaseModel
+from cache import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE')
+STRIPE_TIMEOUT = float(os.getenv('STRIPE_TIMEOUT', '10'))
+STRIPE_MAX_RETRIES = int(os.getenv('STRIPE_MAX_RETRIES', '1'))
+STRIPE_CIRCUIT_FAILURES = int(os.getenv('STRIPE_CIRCUIT_FAILURES', '5'))
+STRIPE_CIRCUIT_RESET_SECONDS = float(os.getenv('STRIPE_CIRCUIT_RESET_SECONDS', '30'))
+
+# Errors that mean Stripe (or the network to it) is unhealthy
+_UNAVAILABLE_ERRORS = (stripe.APIConnectionError, stripe.RateLimitError, stripe.APIError)
+
+class CheckoutSession(BaseModel):
+    session_id: str
+    url: Optional[str] = None
+
+class CheckoutStatus(BaseModel):
+    session_id: str
+    status: Optional[str] = None  # open, complete, expired
+    payment_status: str  # paid, unpaid, no_payment_required
+    amount_total: Optional[int] = None
+    currency: Optional[str] = None
+    metadata: dict = {}
+
+class WebhookEvent(BaseModel):
+    event_id: Optional[str] = None
+    event_type: str
+    session_id: Optional[str] = None
+    payment_status: Optional[str] = None
+
+class CircuitBreaker:
+    """Fail fast after repeated failures, then let one trial call through after a cool-down"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def before_call(self):
+        if self.opened_at is None:
+            return
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            raise HTTPException(status_code=503, detail="Payment provider temporarily unavailable")
+        # Half-open: allow a trial call; a failure re-opens the circuit
+        self.opened_at = time.monotonic()
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Stripe circuit breaker opened")
+            self.opened_at = time.monotonic()
+
+class PaymentGateway:
+    """Stripe checkout operations over a shared, pooled HTTP client"""
+
+    def __init__(self):
+        self._credentials: Optional[dict] = None
+        self._http_client = None
+        self._clients: Dict[str, stripe.StripeClient] = {}
+        self.breaker = CircuitBreaker(STRIPE_CIRCUIT_FAILURES, STRIPE_CIRCUIT_RESET_SECONDS)
+
+    async def credentials(self, db) -> dict:
+        """Stripe keys from site settings (falling back to the environment), cached in memory"""
+        if self._credentials is None:
+            settings = await db.site_settings.find_one(
+                {'settings_id': 'site_settings'},
+                {'_id': 0, 'stripe_api_key': 1, 'stripe_webhook_secret': 1}
+            ) or {}
+            self._credentials = {
+                'api_key': settings.get('stripe_api_key') or os.getenv('STRIPE_API_KEY', 'sk_test_emergent'),
+                'webhook_secret': settings.get('stripe_webhook_secret') or os.getenv('STRIPE_WEBHOOK_SECRET', '')
+            }
+        return self._credentials
+
+    def invalidate_credentials(self):
+        self._credentials = None
+        self._clients.clear()
+
+    def _client(self, api_key: str) -> stripe.StripeClient:
+        if self._http_client is None:
+            self._http_client = stripe.HTTPXClient(timeout=STRIPE_TIMEOUT)
+        client = self._clients.get(api_key)
+        if client is None:
+            options = {'http_client': self._http_client, 'max_network_retries': STRIPE_MAX_RETRIES}
+            if STRIPE_API_BASE:
+                options['base_addresses'] = {'api': STRIPE_API_BASE}
+            client = stripe.StripeClient(api_key, **options)
+            self._clients[api_key] = client
+        return client
+
+    async def _call(self, db, operation):
+        credentials = await self.credentials(db)
+        client = self._client(credentials['api_key'])
+        self.breaker.before_call()
+        try:
+            result = await operation(client)
+        except _UNAVAILABLE_ERRORS as e:
+            self.breaker.record_failure()
+            logger.error(f"Stripe unavailable: {e}")
+            raise HTTPException(status_code=502, detail="Payment provider unavailable")
+        except stripe.StripeError as e:
+            # The request was bad, not the provider
+            self.breaker.record_success()
+            raise HTTPException(status_code=400, detail=e.user_message or str(e))
+        self.breaker.record_success()
+        return result
+
+    async def create_checkout_session(
+        self, db, amount: float, currency: str, success_url: str, cancel_url: str, metadata: dict,
+        expires_at: Optional[datetime] = None
+    ) -> CheckoutSession:
+        """
+        Create a hosted checkout session for a single order total. expires_at
+        (naive UTC) closes the session early; Stripe's default is 24 hours.
+        """
+        params = {
+            'mode': 'payment',
+            'line_items': [{
+                'price_data': {
+                    'currency': currency,
+                    'unit_amount': int(round(amount * 100)),
+                    'product_data': {'name': f"Order {metadata.get('order_id', '')}".strip()}
+                },
+                'quantity': 1
+            }],
+            'success_url': success_url,
+            'cancel_url': cancel_url,
+            'metadata': {k: str(v) for k, v in metadata.items()}
+        }
+        if expires_at is not None:
+            params['expires_at'] = timegm(expires_at.utctimetuple())
+        session = await self._call(db, lambda client: client.v1.checkout.sessions.create_async(params=params))
+        return CheckoutSession(session_id=session.id, url=session.url)
+
+    async def get_checkout_status(self, db, session_id: str) -> CheckoutStatus:
+        """Fetch the current state of a checkout session"""
+        session = await self._call(db, lambda client: client.v1.checkout.sessions.retrieve_async(session_id))
+        return CheckoutStatus(
+            session_id=session.id,
+            status=session.status,
+            payment_status=session.payment_status,
+            amount_total=session.amount_total,
+            currency=session.currency,
+            metadata=session.metadata.to_dict() if session.metadata else {}
+        )
+
+    async def parse_webhook(self, db, payload: bytes, signature: Optional[str]) -> WebhookEvent:
+        """
+        Verify and parse a webhook. Without a configured signing secret the
+        payload can't be trusted, so the session status is re-read from Stripe.
+        """
+        credentials = await self.credentials(db)
+        if credentials['webhook_secret']:
+            try:
+                event = stripe.Webhook.construct_event(payload, signature, credentials['webhook_secret'])
+            except (ValueError, stripe.SignatureVerificationError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid webhook: {e}")
+            data = event.data.object
+            return WebhookEvent(
+                event_id=event.id,
+                event_type=event.type,
+                session_id=data.get('id'),
+                payment_status=data.get('payment_status')
+            )
+
+        try:
+            raw = json.loads(payload)
+            data = raw['data']['object']
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid webhook payload")
+        webhook_event = WebhookEvent(event_id=raw.get('id'), event_type=raw.get('type', ''), session_id=data.get('id'))
+        if webhook_event.event_type.startswith('checkout.session.') and webhook_event.session_id:
+            status = await self.get_checkout_status(db, webhook_event.session_id)
+            webhook_event.payment_status = status.payment_status
+        return webhook_event
+
+    async def close(self):
+        """Close the pooled HTTP client"""
+        if self._http_client is not None:
+            await self._http_client.close_async()
+            self._http_client = None
+        self._clients.clear()
+
+payment_gateway = PaymentGateway()
+invalidation_bus.subscribe('settings', payment_gateway.invalidate_credentials)
@@ -0,0 +1,81 @@
+"""HTTP validators (ETag / Last-Modified) and per-route Cache-Control policies"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+
+# Cache-Control sent with each cacheable route
+CACHE_POLICIES = {
+    'product': 'public, max-age=60, stale-while-revalidate=300',
+    'products': 'public, max-age=30, stale-while-revalidate=120',
+    'recipes': 'public, max-age=300, stale-while-revalidate=600',
+    'blog_post': 'public, max-age=60, stale-while-revalidate=300',
+    'categories': 'public, max-age=300',
+    'regions': 'public, max-age=3600',
+}
+
+def make_etag(*parts) -> str:
+    """Weak ETag from validator parts (ids, updated_at values, query params)"""
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+def content_etag(payload) -> str:
+    """Weak ETag from a hash of the payload itself, for documents without updated_at"""
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return make_etag(hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == '*':
+        return True
+    # Weak comparison: ignore the W/ prefix on either side
+    candidates = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return etag.removeprefix('W/') in candidates
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since is None:
+        return False
+    return _as_utc(last_modified).replace(microsecond=0) <= _as_utc(since)
+
+def apply_validators(
+    request: Request,
+    response: Response,
+    route: str,
+    etag: str,
+    last_modified: Optional[datetime] = None
+) -> Optional[Response]:
+    """
+    Attach ETag/Last-Modified/Cache-Control to the response. If the client's
+    copy is still current, return a bodiless 304 response for the handler to
+    return instead of its payload.
+    Only pass last_modified for single documents: a list can change (a
+    deletion, an item leaving the filter) without any updated_at moving, so
+    list routes validate on their ETag alone.
+    """
+    headers = {'ETag': etag, 'Cache-Control': CACHE_POLICIES[route]}
+    if last_modified is not None:
+        headers['Last-Modified'] = format_datetime(_as_utc(last_modified), usegmt=True)
+
+    if_none_match = request.headers.get('if-none-match')
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, etag)
+    elif if_modified_since is not None and last_modified is not None:
+        fresh = _not_modified_since(if_modified_since, last_modified)
+    else:
+        fresh = False
+
+    if fresh:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,212 @@
+"""
+Declared MongoDB indexes for every collection the API queries.
+
+Runs on app startup (see server.py) and from the CLI:
+    python indexes.py          # create missing indexes, report drift
+    python indexes.py --check  # report drift only, exit 1 if any
+"""
+import asyncio
+import logging
+import os
+import sys
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from search import product_text_index
+from database import get_database, disconnect
+
+logger = logging.getLogger(__name__)
+
+# Options compared when checking an existing index against its declaration
+_COMPARED_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression', 'weights', 'default_language')
+
+INDEXES = {
+    'users': [
+        {'name': 'user_id_unique', 'keys': [('user_id', ASCENDING)], 'unique': True},
+        {'name': 'email_unique', 'keys': [('email', ASCENDING)], 'unique': True},
+    ],
+    'user_sessions': [
+        {'name': 'session_token_unique', 'keys': [('session_token', ASCENDING)], 'unique': True},
+        # Expired sessions are removed by MongoDB as soon as expires_at passes
+        {'name': 'expires_at_ttl', 'keys': [('expires_at', ASCENDING)], 'expireAfterSeconds': 0},
+    ],
+    'products': [
+        {'name': 'product_id_unique', 'keys': [('product_id', ASCENDING)], 'unique': True},
+        {'name': 'culture', 'keys': [('culture', ASCENDING)]},
+        {'name': 'featured', 'keys': [('featured', ASCENDING)]},
+        {'name': 'created_at_product_id', 'keys': [('created_at', DESCENDING), ('product_id', DESCENDING)]},
+        product_text_index(),
+    ],
+    'categories': [
+        {'name': 'category_id_unique', 'keys': [('category_id', ASCENDING)], 'unique': True},
+        {'name': 'name', 'keys': [('name', ASCENDING)]},
+    ],
+    'recipes': [
+        {'name': 'recipe_id_unique', 'keys': [('recipe_id', ASCENDING)], 'unique': True},
+        {'name': 'culture', 'keys': [('culture', ASCENDING)]},
+    ],
+    'orders': [
+        {'name': 'order_id_unique', 'keys': [('order_id', ASCENDING)], 'unique': True},
+        {
+            'name': 'user_id_created_at_order_id',
+            'keys': [('user_id', ASCENDING), ('created_at', DESCENDING), ('order_id', DESCENDING)]
+        },
+        # Admin exports: optional status equality, then a created_at range
+        {'name': 'created_at', 'keys': [('created_at', ASCENDING)]},
+        {'name': 'payment_status_created_at', 'keys': [('payment_status', ASCENDING), ('created_at', ASCENDING)]},
+        {'name': 'order_status_created_at', 'keys': [('order_status', ASCENDING), ('created_at', ASCENDING)]},
+        # Sales analytics backfill
+        {'name': 'payment_status_paid_at', 'keys': [('payment_status', ASCENDING), ('paid_at', ASCENDING)]},
+    ],
+    'stock_reservations': [
+        {'name': 'reservation_id_unique', 'keys': [('reservation_id', ASCENDING)], 'unique': True},
+        {'name': 'order_id', 'keys': [('order_id', ASCENDING)]},
+        {'name': 'status_expires_at', 'keys': [('status', ASCENDING), ('expires_at', ASCENDING)]},
+    ],
+    'payment_transactions': [
+        # PayPal transactions have no session id, so only index string values
+        {
+            'name': 'stripe_session_id_unique',
+            'keys': [('stripe_session_id', ASCENDING)],
+            'unique': True,
+            'partialFilterExpression': {'stripe_session_id': {'$type': 'string'}}
+        },
+        {'name': 'order_id', 'keys': [('order_id', ASCENDING)]},
+        {'name': 'payment_status_created_at', 'keys': [('payment_status', ASCENDING), ('created_at', ASCENDING)]},
+        {'name': 'created_at', 'keys': [('created_at', ASCENDING)]},
+    ],
+    'processed_events': [
+        # Stripe retries webhooks for up to 3 days; keep ids a while longer
+        {'name': 'processed_at_ttl', 'keys': [('processed_at', ASCENDING)], 'expireAfterSeconds': 30 * 24 * 3600},
+    ],
+    'outbox': [
+        {'name': 'dedupe_key_unique', 'keys': [('dedupe_key', ASCENDING)], 'unique': True},
+        {'name': 'status_available_at', 'keys': [('status', ASCENDING), ('available_at', ASCENDING)]},
+        {'name': 'claimed_by', 'keys': [('claimed_by', ASCENDING)]},
+        # Handled messages are dropped once they are older than any webhook id in
+        # processed_events, so a redelivered event can't re-enqueue their side effects
+        {
+            'name': 'processed_at_done_ttl',
+            'keys': [('processed_at', ASCENDING)],
+            'expireAfterSeconds': 45 * 24 * 3600,
+            'partialFilterExpression': {'status': 'done'}
+        },
+    ],
+    'blog_posts': [
+        {'name': 'post_id_unique', 'keys': [('post_id', ASCENDING)], 'unique': True},
+        {'name': 'slug', 'keys': [('slug', ASCENDING)]},
+        {
+            'name': 'published_created_at_post_id',
+            'keys': [('published', ASCENDING), ('created_at', DESCENDING), ('post_id', DESCENDING)]
+        },
+    ],
+    'holiday_notices': [
+        {'name': 'notice_id_unique', 'keys': [('notice_id', ASCENDING)], 'unique': True},
+        {
+            'name': 'active_date_range',
+            'keys': [('is_active', ASCENDING), ('start_date', ASCENDING), ('end_date', ASCENDING)]
+        },
+    ],
+    'announcements': [
+        {'name': 'announcement_id_unique', 'keys': [('announcement_id', ASCENDING)], 'unique': True},
+        {'name': 'active_priority', 'keys': [('is_active', ASCENDING), ('priority', DESCENDING)]},
+    ],
+    'sales_rollups': [
+        {'name': 'granularity_bucket', 'keys': [('granularity', ASCENDING), ('bucket', ASCENDING)]},
+    ],
+    'site_settings': [
+        {'name': 'settings_id_unique', 'keys': [('settings_id', ASCENDING)], 'unique': True},
+    ],
+}
+
+def _declared_options(spec: dict) -> dict:
+    return {k: v for k, v in spec.items() if k in _COMPARED_OPTIONS}
+
+def _existing_options(info: dict) -> dict:
+    options = {k: v for k, v in info.items() if k in _COMPARED_OPTIONS}
+    # The server reports text index weights/language even when left at defaults
+    if 'weights' not in options:
+        options.pop('default_language', None)
+    return options
+
+def _keys_match(spec: dict, info: dict) -> bool:
+    if 'weights' in spec:
+        # Text indexes are stored as _fts/_ftsx; the weights carry the fields
+        return dict(info.get('weights', {})) == spec['weights']
+    return [(field, direction) for field, direction in info['key']] == list(spec['keys'])
+
+def diff_indexes(declared: list, existing: dict) -> dict:
+    """Compare declared index specs with a collection's index_information()"""
+    missing, mismatched = [], []
+    for spec in declared:
+        info = existing.get(spec['name'])
+        if info is None:
+            missing.append(spec)
+        elif not _keys_match(spec, info) or _existing_options(info) != _declared_options(spec):
+            mismatched.append(spec['name'])
+    declared_names = {spec['name'] for spec in declared}
+    undeclared = [name for name in existing if name != '_id_' and name not in declared_names]
+    return {'missing': missing, 'mismatched': mismatched, 'undeclared': undeclared}
+
+async def check_indexes(db) -> list:
+    """Return a drift report without changing anything"""
+    report = []
+    for collection, declared in INDEXES.items():
+        existing = await db[collection].index_information()
+        diff = diff_indexes(declared, existing)
+        for spec in diff['missing']:
+            report.append({'collection': collection, 'index': spec['name'], 'problem': 'missing'})
+        for name in diff['mismatched']:
+            report.append({'collection': collection, 'index': name, 'problem': 'mismatched'})
+        for name in diff['undeclared']:
+            report.append({'collection': collection, 'index': name, 'problem': 'undeclared'})
+    return report
+
+async def ensure_indexes(db) -> list:
+    """
+    Create any missing declared indexes. Mismatched or undeclared indexes are
+    left untouched and returned as drift so they can be fixed deliberately.
+    """
+    drift = []
+    for collection, declared in INDEXES.items():
+        existing = await db[collection].index_information()
+        diff = diff_indexes(declared, existing)
+        for spec in diff['missing']:
+            options = {k: v for k, v in spec.items() if k != 'keys'}
+            try:
+                await db[collection].create_index(spec['keys'], **options)
+                logger.info(f"Created index {collection}.{spec['name']}")
+            except OperationFailure as e:
+                logger.error(f"Could not create index {collection}.{spec['name']}: {e}")
+                drift.append({'collection': collection, 'index': spec['name'], 'problem': 'missing'})
+        for name in diff['mismatched']:
+            drift.append({'collection': collection, 'index': name, 'problem': 'mismatched'})
+        for name in diff['undeclared']:
+            drift.append({'collection': collection, 'index': name, 'problem': 'undeclared'})
+    for item in drift:
+        logger.warning(f"Index drift: {item['collection']}.{item['index']} is {item['problem']}")
+    return drift
+
+async def main(check_only: bool) -> int:
+    db = get_database(
+        mongo_url=os.getenv('MONGO_URL', 'mongodb://localhost:27017'),
+        db_name=os.getenv('DB_NAME', 'test_database')
+    )
+
+    if check_only:
+        drift = await check_indexes(db)
+    else:
+        drift = await ensure_indexes(db)
+
+    if drift:
+        print('⚠️  Index drift detected:')
+        for item in drift:
+            print(f"   - {item['collection']}.{item['index']}: {item['problem']}")
+    else:
+        print('✅ All declared indexes are in place')
+
+    await disconnect()
+    return 1 if drift else 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main('--check' in sys.argv[1:])))
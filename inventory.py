@@ -0,0 +1,170 @@
+"""
+Stock reservations.
+
+Products with a `stock_quantity` are decremented atomically at checkout with
+an update guarded by `stock_quantity >= n`, so concurrent checkouts on the
+same SKU can never oversell. The reserved quantities are recorded in
+`stock_reservations`; they are committed when the order is paid and handed
+back to stock if payment doesn't complete before the reservation expires.
+Opening a Stripe checkout session extends the hold past the session's own
+expiry, so a session can't be paid after its stock went back.
+Products without a stock_quantity are not tracked and are never reserved.
+When stock runs out or comes back, the in_stock facet counts move with it.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from models import OrderItem, StockReservation, ReservedItem
+from facets import apply_facet_changes
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL_MINUTES = int(os.getenv('RESERVATION_TTL_MINUTES', '30'))
+RESERVATION_SWEEP_INTERVAL = float(os.getenv('RESERVATION_SWEEP_INTERVAL', '60'))
+RESERVATION_SWEEP_BATCH = 100
+# Stripe checkout sessions close after this long. Stripe accepts 30 minutes to 24 hours
+# from creation; a minute's margin each side keeps request latency from crossing either
+CHECKOUT_SESSION_MINUTES = min(max(int(os.getenv('CHECKOUT_SESSION_MINUTES', '31')), 31), 24 * 60 - 1)
+# The hold outlives the session by this much so a payment made just before it closes still finds its stock
+CHECKOUT_HOLD_GRACE_MINUTES = int(os.getenv('CHECKOUT_HOLD_GRACE_MINUTES', '10'))
+
+def _adjust_stock(delta: int) -> list:
+    """
+    Update pipeline changing stock_quantity by delta, keeping in_stock in sync
+    and touching updated_at so product ETags and Last-Modified move with stock
+    """
+    return [
+        {'$set': {'stock_quantity': {'$add': ['$stock_quantity', delta]}}},
+        {'$set': {'in_stock': {'$gt': ['$stock_quantity', 0]}, 'updated_at': '$$NOW'}}
+    ]
+
+async def _in_stock_changed(db, now_in_stock: bool):
+    await apply_facet_changes(db, {('in_stock', now_in_stock): 1, ('in_stock', not now_in_stock): -1})
+
+async def _take(db, product_id: str, quantity: int) -> bool:
+    product = await db.products.find_one_and_update(
+        {'product_id': product_id, 'stock_quantity': {'$gte': quantity}},
+        _adjust_stock(-quantity),
+        projection={'_id': 0, 'stock_quantity': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if product is None:
+        return False
+    if product['stock_quantity'] <= 0 < product['stock_quantity'] + quantity:
+        await _in_stock_changed(db, False)
+    return True
+
+async def _give_back(db, product_id: str, quantity: int):
+    product = await db.products.find_one_and_update(
+        {'product_id': product_id, 'stock_quantity': {'$type': 'number'}},
+        _adjust_stock(quantity),
+        projection={'_id': 0, 'stock_quantity': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if product is not None and product['stock_quantity'] - quantity <= 0 < product['stock_quantity']:
+        await _in_stock_changed(db, True)
+
+async def reserve_stock(db, order_id: str, items: List[OrderItem]) -> Optional[str]:
+    """
+    Reserve stock for an order's lines. Raises 409 (and returns anything
+    already taken) if a tracked product is short. Returns the reservation id,
+    or None if no line is stock-tracked.
+    """
+    quantities = Counter()
+    for item in items:
+        quantities[item.product_id] += item.quantity
+
+    results = await asyncio.gather(*(_take(db, pid, qty) for pid, qty in quantities.items()))
+    taken = [pid for pid, ok in zip(quantities, results) if ok]
+    failed = [pid for pid, ok in zip(quantities, results) if not ok]
+
+    if failed:
+        # A failed guard means either too little stock or an untracked product
+        untracked = {
+            doc['product_id'] async for doc in db.products.find(
+                {'product_id': {'$in': failed}, 'stock_quantity': None},
+                {'_id': 0, 'product_id': 1}
+            )
+        }
+        short = [pid for pid in failed if pid not in untracked]
+        if short:
+            await asyncio.gather(*(_give_back(db, pid, quantities[pid]) for pid in taken))
+            raise HTTPException(status_code=409, detail={
+                'message': 'Insufficient stock',
+                'problems': [{'product_id': pid, 'problem': 'insufficient_stock'} for pid in short]
+            })
+
+    if not taken:
+        return None
+
+    reservation = StockReservation(
+        order_id=order_id,
+        items=[ReservedItem(product_id=pid, quantity=quantities[pid]) for pid in taken],
+        expires_at=datetime.utcnow() + timedelta(minutes=RESERVATION_TTL_MINUTES)
+    )
+    await db.stock_reservations.insert_one(reservation.dict())
+    return reservation.reservation_id
+
+async def hold_for_checkout(db, order_id: str) -> datetime:
+    """
+    Extend an order's pending reservation to cover a new checkout session.
+    Returns when the session must expire. Raises 409 if the reservation was
+    already released: its stock may have been sold again.
+    """
+    now = datetime.utcnow()
+    session_expires_at = now + timedelta(minutes=CHECKOUT_SESSION_MINUTES)
+    reservation = await db.stock_reservations.find_one_and_update(
+        {'order_id': order_id, 'status': 'pending'},
+        {
+            '$max': {'expires_at': session_expires_at + timedelta(minutes=CHECKOUT_HOLD_GRACE_MINUTES)},
+            '$set': {'updated_at': now}
+        },
+        projection={'_id': 0, 'status': 1}
+    )
+    if reservation is None and await db.stock_reservations.count_documents(
+        {'order_id': order_id, 'status': 'released'}, limit=1
+    ):
+        raise HTTPException(status_code=409, detail="Stock reservation expired; please place the order again")
+    return session_expires_at
+
+async def commit_reservation(db, order_id: str):
+    """Make an order's reservation permanent once it is paid"""
+    now = datetime.utcnow()
+    reservation = await db.stock_reservations.find_one_and_update(
+        {'order_id': order_id, 'status': {'$in': ['pending', 'released']}},
+        {'$set': {'status': 'committed', 'updated_at': now}},
+        projection={'_id': 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if reservation and reservation['status'] == 'released':
+        # Paid after the hold expired: the stock went back, so take it again
+        for item in reservation['items']:
+            if not await _take(db, item['product_id'], item['quantity']):
+                logger.error(f"Order {order_id} paid after its reservation expired; "
+                             f"{item['product_id']} is now oversold")
+
+async def release_expired_reservations(db) -> int:
+    """Return stock held by unpaid reservations past their expiry"""
+    released = 0
+    now = datetime.utcnow()
+    while released < RESERVATION_SWEEP_BATCH:
+        # Flipping the status first means only one worker releases each hold
+        reservation = await db.stock_reservations.find_one_and_update(
+            {'status': 'pending', 'expires_at': {'$lte': now}},
+            {'$set': {'status': 'released', 'updated_at': now}},
+            projection={'_id': 0}
+        )
+        if reservation is None:
+            break
+        await asyncio.gather(*(
+            _give_back(db, item['product_id'], item['quantity']) for item in reservation['items']
+        ))
+        released += 1
+    if released:
+        logger.info(f"Released {released} expired stock reservations")
+    return released
@@ -0,0 +1,233 @@
+"""
+Request and MongoDB instrumentation, exposed in Prometheus text format.
+
+- MetricsMiddleware times every request per route template and tracks the
+  number of requests in flight.
+- MongoCommandListener (registered on the shared client, see database.py)
+  counts commands and their latency, both globally per command name and
+  against the request that issued them.
+- track('auth') / track('serialize') add hot-path sections to the current
+  request's breakdown.
+
+Per-request stats live in a context variable holding a mutable RequestStats;
+Motor runs driver calls with a copy of the caller's context, so commands are
+attributed to the request even though they complete on executor threads.
+
+Metrics are per process; scrape each worker (or aggregate upstream).
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Sequence, Tuple
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUNDTRIP_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a label tuple"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: Tuple, value: float):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # bucket counts, +Inf count, sum
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = [(key, list(counts), count, total) for key, (counts, count, total) in self._series.items()]
+        for key, counts, count, total in snapshot:
+            labels = _format_labels(self.labels, key)
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {count}'
+            yield f"{self.name}_sum{{{labels}}} {total}"
+            yield f"{self.name}_count{{{labels}}} {count}"
+
+class Counter:
+    """Monotonic counter (or gauge, with kind='gauge') keyed by a label tuple"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), kind: str = 'counter'):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.kind = kind
+        self._values: Dict[Tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: Tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            snapshot = list(self._values.items())
+        for key, value in snapshot:
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}"
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Tuple, values: Tuple) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+# ---- request stats ----
+
+class RequestStats:
+    """Time and round-trips attributed to one request"""
+    __slots__ = ('mongo_commands', 'mongo_seconds', 'sections', '_lock')
+
+    def __init__(self):
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self.sections: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_command(self, seconds: float):
+        with self._lock:
+            self.mongo_commands += 1
+            self.mongo_seconds += seconds
+
+    def add_section(self, section: str, seconds: float):
+        with self._lock:
+            self.sections[section] += seconds
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+@contextmanager
+def track(section: str):
+    """Add the wall time of the block to the current request's `section`"""
+    stats = _request_stats.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_section(section, time.perf_counter() - started)
+
+# ---- metric families ----
+
+http_requests = Counter('http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'))
+http_latency = Histogram('http_request_duration_seconds', 'HTTP request latency', ('method', 'route'), LATENCY_BUCKETS)
+http_in_flight = Counter('http_requests_in_flight', 'HTTP requests currently being served', kind='gauge')
+request_roundtrips = Histogram('http_request_mongo_roundtrips', 'MongoDB commands issued per request', ('route',), ROUNDTRIP_BUCKETS)
+request_section_seconds = Counter(
+    'http_request_section_seconds_total',
+    'Time spent per request section (mongo, auth, serialize); auth includes its own lookups',
+    ('route', 'section')
+)
+mongo_commands = Counter('mongodb_commands_total', 'MongoDB commands by name and outcome', ('command', 'outcome'))
+mongo_latency = Histogram('mongodb_command_duration_seconds', 'MongoDB command latency', ('command',), LATENCY_BUCKETS)
+
+_FAMILIES = [
+    http_requests, http_latency, http_in_flight, request_roundtrips,
+    request_section_seconds, mongo_commands, mongo_latency
+]
+
+# Extra gauges read at scrape time: name -> (help, callable returning {label_value: value})
+_collectors: Dict[str, Tuple[str, str, Callable[[], Dict[str, float]]]] = {}
+
+def register_stats(name: str, help: str, label: str, stats: Callable[[], Dict[str, float]]):
+    """Expose a stats dict (e.g. password_hash_stats) as one labelled gauge"""
+    _collectors[name] = (help, label, stats)
+
+def render_metrics() -> str:
+    lines = []
+    for family in _FAMILIES:
+        lines.extend(family.render())
+    for name, (help, label, stats) in _collectors.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in stats().items():
+            lines.append(f'{name}{{{label}="{_escape(key)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+# ---- MongoDB ----
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Attribute driver round-trips to the metric families and the current request"""
+
+    def started(self, event):
+        pass
+
+    def _finished(self, event, outcome: str):
+        seconds = event.duration_micros / 1_000_000
+        mongo_commands.inc((event.command_name, outcome))
+        mongo_latency.observe((event.command_name,), seconds)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.add_command(seconds)
+
+    def succeeded(self, event):
+        self._finished(event, 'ok')
+
+    def failed(self, event):
+        self._finished(event, 'error')
+
+# ---- HTTP ----
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight count and per-request breakdown"""
+
+    def __init__(self, app, exclude: Sequence[str] = ('/metrics',)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        http_in_flight.inc(amount=1)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.inc(amount=-1)
+            _request_stats.reset(token)
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            method = scope['method']
+            http_requests.inc((method, route, str(status)))
+            http_latency.observe((method, route), elapsed)
+            request_roundtrips.observe((route,), stats.mongo_commands)
+            request_section_seconds.inc((route, 'mongo'), stats.mongo_seconds)
+            for section, seconds in stats.sections.items():
+                request_section_seconds.inc((route, section), seconds)
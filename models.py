@@ -36,6 +36,11 @@ class UserResponse(BaseModel):
     picture: Optional[str] = None
     is_admin: bool = False
 
+    @classmethod
+    def from_user(cls, user: 'User') -> 'UserResponse':
+        # User is already validated; skip a second validation pass
+        return cls.model_construct(**{name: getattr(user, name) for name in cls.model_fields})
+
 class UserSession(BaseModel):
     session_token: str
     user_id: str
@@ -57,6 +62,7 @@ class Product(BaseModel):
     ingredients: Optional[str] = None
     storage_instructions: Optional[str] = None
     in_stock: bool = True
+    stock_quantity: Optional[int] = None  # None = stock not tracked
     featured: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -73,6 +79,7 @@ class ProductCreate(BaseModel):
     description: str
     ingredients: Optional[str] = None
     storage_instructions: Optional[str] = None
+    stock_quantity: Optional[int] = None
     featured: bool = False
 
 class ProductUpdate(BaseModel):
@@ -88,6 +95,7 @@ class ProductUpdate(BaseModel):
     ingredients: Optional[str] = None
     storage_instructions: Optional[str] = None
     in_stock: Optional[bool] = None
+    stock_quantity: Optional[int] = None
     featured: Optional[bool] = None
 
 # Category Models
@@ -146,6 +154,9 @@ class OrderItem(BaseModel):
     price: float
     quantity: int
     image: str
+    # Filled from the catalog at checkout, for sales analytics
+    category: Optional[str] = None
+    culture: Optional[str] = None
 
 class DeliveryInfo(BaseModel):
     first_name: str
@@ -169,6 +180,7 @@ class Order(BaseModel):
     payment_method: str  # stripe or paypal
     payment_status: str = 'pending'  # pending, paid, failed
     order_status: str = 'processing'  # processing, shipped, delivered, cancelled
+    reservation_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -177,6 +189,20 @@ class OrderCreate(BaseModel):
     delivery_info: DeliveryInfo
     payment_method: str
 
+# Stock Reservation Models
+class ReservedItem(BaseModel):
+    product_id: str
+    quantity: int
+
+class StockReservation(BaseModel):
+    reservation_id: str = Field(default_factory=lambda: generate_id('res'))
+    order_id: str
+    items: List[ReservedItem]
+    status: str = 'pending'  # pending, committed, released
+    expires_at: datetime
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 # Payment Models
 class PaymentTransaction(BaseModel):
     transaction_id: str = Field(default_factory=lambda: generate_id('txn'))
@@ -0,0 +1,47 @@
+"""
+Admin exports of orders and payment transactions.
+
+Filters map onto the indexes declared in indexes.py: an optional status
+equality followed by a created_at range, sorted by created_at, so the
+server walks the index instead of sorting in memory. Orders filtered on
+both payment_status and order_status walk one status index and check the
+other status on each document.
+"""
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from streaming import stream_documents
+
+ORDER_CSV_COLUMNS = [
+    'order_id', 'user_id', 'created_at', 'updated_at', 'paid_at',
+    'payment_method', 'payment_status', 'order_status',
+    'subtotal', 'delivery_fee', 'total',
+    'delivery_info.first_name', 'delivery_info.last_name', 'delivery_info.email', 'delivery_info.phone',
+    'delivery_info.address', 'delivery_info.city', 'delivery_info.province', 'delivery_info.postal_code',
+    'items',
+]
+
+TRANSACTION_CSV_COLUMNS = [
+    'transaction_id', 'order_id', 'user_id', 'created_at', 'updated_at',
+    'amount', 'currency', 'payment_method', 'payment_status',
+    'stripe_session_id', 'paypal_order_id',
+]
+
+def export_filter(created_from: Optional[datetime] = None, created_to: Optional[datetime] = None, **equals) -> dict:
+    """Equality filters (None values skipped) plus a half-open created_at range"""
+    query = {field: value for field, value in equals.items() if value is not None}
+    created = {}
+    if created_from is not None:
+        created['$gte'] = created_from
+    if created_to is not None:
+        created['$lt'] = created_to
+    if created:
+        query['created_at'] = created
+    return query
+
+def export_orders(db, fmt: str, query: dict, batch_size: int) -> AsyncIterator[bytes]:
+    cursor = db.orders.find(query, {'_id': 0}).sort('created_at', 1)
+    return stream_documents(cursor, fmt, ORDER_CSV_COLUMNS, batch_size=batch_size)
+
+def export_transactions(db, fmt: str, query: dict, batch_size: int) -> AsyncIterator[bytes]:
+    cursor = db.payment_transactions.find(query, {'_id': 0}).sort('created_at', 1)
+    return stream_documents(cursor, fmt, TRANSACTION_CSV_COLUMNS, batch_size=batch_size)
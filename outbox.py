@@ -0,0 +1,116 @@
+"""
+Transactional outbox.
+
+Side effects of a state change (e.g. committing stock when an order is paid)
+are written to the `outbox` collection together with the change itself and
+carried out later by a background worker that drains the outbox in batches.
+Delivery is at-least-once, so handlers must be idempotent. Handled messages
+are kept for 45 days (a partial TTL index in indexes.py) so their dedupe keys
+outlast redelivered webhooks, then removed.
+"""
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '2'))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '10'))
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', '300'))
+
+_handlers: Dict[str, Callable[..., Awaitable]] = {}
+
+def outbox_handler(event_type: str):
+    """Register `async def handler(db, payload)` for an outbox event type"""
+    def register(func):
+        _handlers[event_type] = func
+        return func
+    return register
+
+async def enqueue(db, event_type: str, payload: dict, dedupe_key: str, session=None) -> bool:
+    """
+    Add a message to the outbox. Messages are unique per dedupe_key, so
+    re-enqueueing the same side effect is a no-op. Returns False on a duplicate.
+    """
+    now = datetime.utcnow()
+    # An upsert rather than insert + DuplicateKeyError: inside a transaction a
+    # duplicate key error aborts the whole transaction on the server
+    result = await db.outbox.update_one(
+        {'dedupe_key': dedupe_key},
+        {'$setOnInsert': {
+            'message_id': uuid.uuid4().hex,
+            'dedupe_key': dedupe_key,
+            'type': event_type,
+            'payload': payload,
+            'status': 'pending',  # pending, processing, done, failed
+            'attempts': 0,
+            'available_at': now,
+            'created_at': now
+        }},
+        upsert=True,
+        session=session
+    )
+    return result.upserted_id is not None
+
+async def _claim_batch(db) -> list:
+    now = datetime.utcnow()
+    # Messages whose worker died mid-batch become available again
+    await db.outbox.update_many(
+        {'status': 'processing', 'claimed_at': {'$lt': now - timedelta(seconds=OUTBOX_LEASE_SECONDS)}},
+        {'$set': {'status': 'pending'}}
+    )
+    candidates = await db.outbox.find(
+        {'status': 'pending', 'available_at': {'$lte': now}},
+        {'_id': 1}
+    ).sort('available_at', 1).limit(OUTBOX_BATCH_SIZE).to_list(length=OUTBOX_BATCH_SIZE)
+    if not candidates:
+        return []
+    token = uuid.uuid4().hex
+    await db.outbox.update_many(
+        {'_id': {'$in': [doc['_id'] for doc in candidates]}, 'status': 'pending'},
+        {'$set': {'status': 'processing', 'claimed_by': token, 'claimed_at': now}}
+    )
+    return await db.outbox.find({'claimed_by': token, 'status': 'processing'}).to_list(length=OUTBOX_BATCH_SIZE)
+
+async def drain_outbox(db) -> int:
+    """Process pending outbox messages batch by batch; returns how many were handled"""
+    handled = 0
+    while True:
+        batch = await _claim_batch(db)
+        if not batch:
+            break
+        updates = []
+        for message in batch:
+            now = datetime.utcnow()
+            handler = _handlers.get(message['type'])
+            try:
+                if handler is None:
+                    raise LookupError(f"No outbox handler for {message['type']}")
+                await handler(db, message['payload'])
+                updates.append(UpdateOne(
+                    {'_id': message['_id']},
+                    {'$set': {'status': 'done', 'processed_at': now}}
+                ))
+            except Exception as e:
+                attempts = message.get('attempts', 0) + 1
+                status = 'failed' if attempts >= OUTBOX_MAX_ATTEMPTS else 'pending'
+                logger.error(f"Outbox {message['type']} {message['dedupe_key']} failed (attempt {attempts}): {e}")
+                updates.append(UpdateOne(
+                    {'_id': message['_id']},
+                    {'$set': {
+                        'status': status,
+                        'attempts': attempts,
+                        'last_error': str(e),
+                        # Exponential backoff, capped at ten minutes
+                        'available_at': now + timedelta(seconds=min(2 ** attempts, 600))
+                    }}
+                ))
+        await db.outbox.bulk_write(updates, ordered=False)
+        handled += len(batch)
+        if len(batch) < OUTBOX_BATCH_SIZE:
+            break
+    return handled
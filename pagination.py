@@ -0,0 +1,92 @@
+"""Keyset (cursor) pagination over a stable, indexed sort key"""
+import base64
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from bson import json_util
+
+MAX_PAGE_SIZE = 100
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(values: list, direction: str) -> str:
+    """Encode sort-key values into an opaque cursor"""
+    raw = json_util.dumps({'k': values, 'd': direction})
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[list, str]:
+    """Decode a cursor created by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values, direction = data['k'], data['d']
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values, direction
+
+def keyset_filter(sort: List[Tuple[str, int]], values: list, direction: str) -> dict:
+    """
+    Build a filter matching documents strictly after (direction 'next') or
+    before (direction 'prev') the given sort-key values
+    """
+    if len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    clauses = []
+    for i, (field, order) in enumerate(sort):
+        forward = order == 1
+        if direction == 'prev':
+            forward = not forward
+        clause = {sort[j][0]: values[j] for j in range(i)}
+        clause[field] = {'$gt' if forward else '$lt': values[i]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+def _sort_values(doc: dict, sort: List[Tuple[str, int]]) -> list:
+    return [doc.get(field) for field, _ in sort]
+
+async def keyset_page(
+    collection,
+    query: dict,
+    projection: dict,
+    sort: List[Tuple[str, int]],
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0
+) -> dict:
+    """
+    Fetch one page ordered by `sort` (which must end in a unique field).
+    With a cursor the page starts right after/before the cursor position;
+    without one it falls back to `skip` for page-number compatibility.
+    Returns the documents plus next/prev cursors (None at either end).
+    """
+    direction = 'next'
+    find_query = query
+    find_sort = sort
+    if cursor:
+        values, direction = decode_cursor(cursor)
+        bound = keyset_filter(sort, values, direction)
+        find_query = {'$and': [query, bound]} if query else bound
+        if direction == 'prev':
+            find_sort = [(field, -order) for field, order in sort]
+        skip = 0
+
+    find_cursor = collection.find(find_query, projection).sort(find_sort)
+    if skip:
+        find_cursor = find_cursor.skip(skip)
+    docs = await find_cursor.limit(limit + 1).to_list(length=limit + 1)
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if direction == 'prev':
+        docs.reverse()
+
+    next_cursor = prev_cursor = None
+    if docs:
+        if has_more or direction == 'prev':
+            next_cursor = encode_cursor(_sort_values(docs[-1], sort), 'next')
+        if (cursor and direction == 'next') or (direction == 'prev' and has_more) or (not cursor and skip):
+            prev_cursor = encode_cursor(_sort_values(docs[0], sort), 'prev')
+
+    return {'items': docs, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
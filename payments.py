@@ -0,0 +1,84 @@
+"""
+Payment event processing.
+
+Stripe status changes (webhooks and status checks) go through
+apply_payment_status(), which updates the payment transaction and its order
+and enqueues downstream side effects in the outbox. Every step is
+idempotent, so webhook retries and duplicate deliveries are safe; the Stripe
+event id is recorded last so a crash part-way through is repaired by the
+retry. With MONGO_TRANSACTIONS=true (replica set / Atlas) the whole thing
+runs in a single multi-document transaction.
+"""
+import os
+from datetime import datetime
+from typing import Optional
+from pymongo import ReturnDocument
+from inventory import commit_reservation
+from outbox import enqueue, outbox_handler
+
+MONGO_TRANSACTIONS = os.getenv('MONGO_TRANSACTIONS', 'false').lower() == 'true'
+
+async def _apply(db, session_id: str, payment_status: str, event_id: Optional[str], session=None) -> bool:
+    now = datetime.utcnow()
+
+    # Never downgrade a paid transaction (e.g. a late 'unpaid' status check)
+    transaction = await db.payment_transactions.find_one_and_update(
+        {'stripe_session_id': session_id, 'payment_status': {'$ne': 'paid'}},
+        {'$set': {'payment_status': payment_status, 'updated_at': now}},
+        projection={'_id': 0, 'order_id': 1},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if transaction is None and payment_status == 'paid':
+        # Already paid: re-apply the order update in case a previous attempt stopped short
+        transaction = await db.payment_transactions.find_one(
+            {'stripe_session_id': session_id}, {'_id': 0, 'order_id': 1}, session=session
+        )
+    if transaction is None:
+        return False
+
+    if payment_status == 'paid':
+        order_id = transaction['order_id']
+        await db.orders.update_one(
+            {'order_id': order_id, 'payment_status': {'$ne': 'paid'}},
+            {'$set': {'payment_status': 'paid', 'order_status': 'processing', 'paid_at': now, 'updated_at': now}},
+            session=session
+        )
+        await enqueue(
+            db, 'order.paid', {'order_id': order_id, 'stripe_session_id': session_id},
+            dedupe_key=f'order.paid:{order_id}', session=session
+        )
+        await enqueue(
+            db, 'analytics.order_paid', {'order_id': order_id},
+            dedupe_key=f'analytics.order_paid:{order_id}', session=session
+        )
+
+    if event_id:
+        await db.processed_events.update_one(
+            {'_id': event_id},
+            {'$setOnInsert': {'stripe_session_id': session_id, 'processed_at': now}},
+            upsert=True,
+            session=session
+        )
+    return True
+
+async def apply_payment_status(db, session_id: str, payment_status: str, event_id: Optional[str] = None) -> bool:
+    """
+    Apply a Stripe checkout status to the transaction and order.
+    Returns False if the event was already processed or the session is unknown.
+    """
+    if event_id and await db.processed_events.find_one({'_id': event_id}, {'_id': 1}):
+        return False
+
+    if not MONGO_TRANSACTIONS:
+        return await _apply(db, session_id, payment_status, event_id)
+
+    async with await db.client.start_session() as session:
+        async def run(s):
+            return await _apply(db, session_id, payment_status, event_id, session=s)
+        return await session.with_transaction(run)
+
+@outbox_handler('order.paid')
+async def commit_paid_order_stock(db, payload: dict):
+    """Make the paid order's stock reservation permanent"""
+    await commit_reservation(db, payload['order_id'])
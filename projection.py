@@ -0,0 +1,40 @@
+"""Sparse fieldsets: `?fields=a,b,c` validated against a model and turned into a Mongo projection"""
+from typing import Iterable, List, Optional, Type
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel], exclude: Iterable[str] = ()) -> Optional[List[str]]:
+    """
+    Parse a comma-separated `fields` parameter. Returns None when no
+    selection was requested; raises 400 for names not on the model.
+    """
+    if not fields:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+    allowed = set(model.model_fields) - set(exclude)
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+def build_projection(names: Optional[List[str]], internal: Iterable[str] = (), default: Optional[dict] = None) -> dict:
+    """
+    Inclusion projection for the requested fields plus any `internal` fields
+    the handler needs itself (sort keys, validators). Without a selection the
+    `default` projection is used.
+    """
+    if names is None:
+        return dict(default or {'_id': 0})
+    projection = {'_id': 0}
+    for name in (*names, *internal):
+        projection[name] = 1
+    return projection
+
+def trim_documents(docs: List[dict], names: Optional[List[str]]):
+    """Drop internal-only fields from documents fetched with build_projection"""
+    if names is None:
+        return
+    keep = set(names)
+    for doc in docs:
+        for key in [key for key in doc if key not in keep]:
+            del doc[key]
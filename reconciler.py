@@ -0,0 +1,76 @@
+"""
+Background reconciliation of pending Stripe checkouts.
+
+Webhooks normally settle payments. Anything still unsettled after
+RECONCILE_MIN_AGE seconds is looked up at Stripe by this task, in small
+rate-limited batches, so the status endpoint can be a plain database read
+no matter how often browsers poll it. Each transaction is claimed via its
+`next_check_at` field so only one worker queries it per round, with
+exponential backoff between rounds.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from gateway import payment_gateway
+from payments import apply_payment_status
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = float(os.getenv('RECONCILE_INTERVAL', '5'))
+RECONCILE_MIN_AGE = int(os.getenv('RECONCILE_MIN_AGE', '10'))
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', '20'))
+RECONCILE_MAX_CALLS_PER_SECOND = float(os.getenv('RECONCILE_MAX_CALLS_PER_SECOND', '5'))
+# Stripe checkout sessions expire after 24 hours at most
+RECONCILE_MAX_AGE_HOURS = int(os.getenv('RECONCILE_MAX_AGE_HOURS', '25'))
+
+UNSETTLED_STATUSES = ['pending', 'unpaid']
+
+async def _claim(db, transaction: dict, now: datetime) -> bool:
+    attempts = transaction.get('reconcile_attempts', 0)
+    delay = min(RECONCILE_INTERVAL * (2 ** attempts), 600)
+    result = await db.payment_transactions.update_one(
+        {
+            'transaction_id': transaction['transaction_id'],
+            'payment_status': {'$in': UNSETTLED_STATUSES},
+            '$or': [{'next_check_at': {'$exists': False}}, {'next_check_at': {'$lte': now}}]
+        },
+        {'$set': {'next_check_at': now + timedelta(seconds=delay)}, '$inc': {'reconcile_attempts': 1}}
+    )
+    return result.modified_count == 1
+
+async def reconcile_pending_payments(db) -> int:
+    """Query Stripe for one batch of unsettled checkouts and apply the results"""
+    now = datetime.utcnow()
+    candidates = await db.payment_transactions.find(
+        {
+            'payment_method': 'stripe',
+            'payment_status': {'$in': UNSETTLED_STATUSES},
+            'created_at': {
+                '$lte': now - timedelta(seconds=RECONCILE_MIN_AGE),
+                '$gte': now - timedelta(hours=RECONCILE_MAX_AGE_HOURS)
+            },
+            '$or': [{'next_check_at': {'$exists': False}}, {'next_check_at': {'$lte': now}}]
+        },
+        {'_id': 0, 'transaction_id': 1, 'stripe_session_id': 1, 'reconcile_attempts': 1}
+    ).sort('created_at', 1).limit(RECONCILE_BATCH_SIZE).to_list(length=RECONCILE_BATCH_SIZE)
+
+    reconciled = 0
+    for transaction in candidates:
+        if not transaction.get('stripe_session_id') or not await _claim(db, transaction, now):
+            continue
+        try:
+            status = await payment_gateway.get_checkout_status(db, transaction['stripe_session_id'])
+        except HTTPException as e:
+            if e.status_code in (502, 503):
+                # Stripe is struggling; leave the rest for a later round
+                logger.warning(f"Payment reconciliation paused: {e.detail}")
+                break
+            logger.error(f"Could not reconcile {transaction['stripe_session_id']}: {e.detail}")
+            continue
+        payment_status = 'expired' if status.status == 'expired' and status.payment_status != 'paid' else status.payment_status
+        await apply_payment_status(db, transaction['stripe_session_id'], payment_status)
+        reconciled += 1
+        await asyncio.sleep(1 / RECONCILE_MAX_CALLS_PER_SECOND)
+    return reconciled
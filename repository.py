@@ -0,0 +1,41 @@
+"""
+Shared write helpers for the admin routes.
+
+Updates are a single find_one_and_update that returns the document we need
+(after the change by default) instead of update_one followed by a re-read,
+and category product_count adjustments go out as one bulk_write.
+"""
+from typing import Dict, Optional
+from pymongo import ReturnDocument, UpdateOne
+
+DEFAULT_PROJECTION = {'_id': 0}
+
+async def update_and_fetch(
+    collection,
+    query: dict,
+    changes: dict,
+    projection: Optional[dict] = None,
+    upsert: bool = False,
+    before: bool = False
+) -> Optional[dict]:
+    """
+    `$set` changes on the matching document in one round trip. Returns the
+    updated document (or the previous one with before=True), None if nothing
+    matched.
+    """
+    return await collection.find_one_and_update(
+        query,
+        {'$set': changes},
+        projection=projection or DEFAULT_PROJECTION,
+        upsert=upsert,
+        return_document=ReturnDocument.BEFORE if before else ReturnDocument.AFTER
+    )
+
+async def adjust_category_counts(db, changes: Dict[str, int]):
+    """Apply product_count deltas to categories in one bulk_write"""
+    if not changes:
+        return
+    await db.categories.bulk_write(
+        [UpdateOne({'name': name}, {'$inc': {'product_count': delta}}) for name, delta in changes.items()],
+        ordered=False
+    )
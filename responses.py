@@ -0,0 +1,32 @@
+"""
+Fast JSON responses.
+
+FastJSONResponse renders with orjson, which handles datetimes natively and
+is several times faster than the stdlib encoder. Read handlers return
+json_response(...) directly so FastAPI skips its jsonable_encoder pass over
+documents that are already plain, projection-shaped Mongo dicts.
+"""
+from typing import Any, Mapping, Optional
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from metrics import track
+
+def _default(obj: Any):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        with track('serialize'):
+            return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[Mapping[str, str]] = None) -> FastJSONResponse:
+    """Serialize a handler result directly, bypassing jsonable_encoder"""
+    return FastJSONResponse(content, status_code=status_code, headers=dict(headers) if headers else None)
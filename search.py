@@ -0,0 +1,45 @@
+"""Catalog search backed by a weighted MongoDB text index"""
+import re
+import unicodedata
+from typing import List, Optional
+
+PRODUCT_TEXT_INDEX_NAME = 'products_text_search'
+
+# Relative field weights used by the text index to rank matches
+PRODUCT_SEARCH_WEIGHTS = {
+    'name': 10,
+    'category': 5,
+    'country': 5,
+    'description': 1
+}
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+def fold_text(value: str) -> str:
+    """Lowercase a string and strip accents (e.g. 'Bogotá' -> 'bogota')"""
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+def tokenize(value: str) -> List[str]:
+    """Split a string into accent-folded search tokens"""
+    return _TOKEN_RE.findall(fold_text(value))
+
+def build_text_search(search: str) -> Optional[dict]:
+    """
+    Build a $text filter for a user search string.
+    Tokens are folded and re-joined so user input can't inject
+    text-search operators (phrases, negations).
+    """
+    tokens = tokenize(search)
+    if not tokens:
+        return None
+    return {'$search': ' '.join(tokens)}
+
+def product_text_index() -> dict:
+    """Keys and options for the product text index"""
+    return {
+        'keys': [(field, 'text') for field in PRODUCT_SEARCH_WEIGHTS],
+        'name': PRODUCT_TEXT_INDEX_NAME,
+        'weights': PRODUCT_SEARCH_WEIGHTS,
+        'default_language': 'english'
+    }
@@ -1,6 +1,7 @@
 # Seed data for initial database setup
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database, disconnect
+from facets import rebuild_facets
 import os
 from datetime import datetime
 
@@ -261,11 +262,10 @@ mock_testimonials = [
 ]
 
 async def seed_database():
-    mongo_url = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
-    db_name = os.getenv('DB_NAME', 'test_database')
-    
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[db_name]
+    db = get_database(
+        mongo_url=os.getenv('MONGO_URL', 'mongodb://localhost:27017'),
+        db_name=os.getenv('DB_NAME', 'test_database')
+    )
     
     # Clear existing data
     await db.products.delete_many({})
@@ -281,13 +281,8 @@ async def seed_database():
     await db.recipes.insert_many(mock_recipes)
     await db.testimonials.insert_many(mock_testimonials)
     
-    # Update category counts
-    for category in mock_categories:
-        count = await db.products.count_documents({'category': category['name']})
-        await db.categories.update_one(
-            {'category_id': category['category_id']},
-            {'$set': {'product_count': count}}
-        )
+    # Facet counts and category product counts, from one $facet aggregation
+    await rebuild_facets(db)
     
     print('✅ Database seeded successfully!')
     print(f'   - {len(mock_products)} products')
@@ -296,7 +291,7 @@ async def seed_database():
     print(f'   - {len(mock_recipes)} recipes')
     print(f'   - {len(mock_testimonials)} testimonials')
     
-    client.close()
+    await disconnect()
 
 if __name__ == '__main__':
     asyncio.run(seed_database())
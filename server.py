@@ -1,14 +1,18 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Header, Cookie, Request, Response, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from typing import Optional, List
 from datetime import datetime, timedelta, timezone
 import asyncio
+
+ROOT_DIR = Path(__file__).parent
+# Before the app modules are imported: several read their settings at import time
+load_dotenv(ROOT_DIR / '.env')
+
 # Import models and auth
 from models import (
     User, UserCreate, UserLogin, UserResponse, UserSession,
@@ -20,33 +24,43 @@ from models import (
     PaymentTransaction,
     Testimonial
 )
-from auth import hash_password, verify_password, create_access_token, get_current_user, get_current_admin
-
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# MongoDB connection
-from pymongo import MongoClient
-import os
-
-mongo_url = os.getenv("MONGO_URL")
-
-if mongo_url:
-    client = MongoClient(mongo_url)
-    db = client.get_database()
-    print("✅ MongoDB connected")
-else:
-    db = None
+from auth import (
+    hash_password_async, verify_password_async, needs_rehash, shutdown_password_pool, password_hash_stats,
+    create_access_token, get_current_user, get_current_admin, invalidate_user
+)
+from search import build_text_search
+from indexes import ensure_indexes
+from pagination import clamp_limit, keyset_page
+from totals import product_totals, blog_post_totals, product_filter_key, count_with_cache
+from cache import reference_cache, invalidation_bus, invalidate, CACHE_SYNC_INTERVAL
+from background import PeriodicTask
+from http_cache import apply_validators, make_etag, content_etag
+from database import get_database, connect, disconnect
+from catalog import product_cache, reprice_cart
+from inventory import reserve_stock, hold_for_checkout, release_expired_reservations, RESERVATION_SWEEP_INTERVAL
+from payments import apply_payment_status
+from outbox import drain_outbox, OUTBOX_POLL_INTERVAL
+from gateway import payment_gateway, CheckoutStatus
+from reconciler import reconcile_pending_payments, RECONCILE_INTERVAL
+from view_counter import view_counter, VIEW_FLUSH_INTERVAL
+from blog_cache import blog_post_cache, make_excerpt, BLOG_LIST_PROJECTION
+from projection import parse_fields, build_projection, trim_documents
+from responses import FastJSONResponse, json_response
+from compression import CompressionMiddleware, compression_stats
+from metrics import MetricsMiddleware, register_stats, render_metrics
+from repository import update_and_fetch
+from facets import facet_changes, apply_facet_changes, facets_for_query, verify_facets, FACET_FIELDS, FACET_REPAIR_INTERVAL
+from catalog_io import import_products, export_products, detect_format, IMPORT_BATCH_SIZE
+from streaming import clamp_batch_size, FORMATS, EXPORT_BATCH_SIZE
+from order_exports import export_filter, export_orders, export_transactions
+from analytics import sales_summary, backfill_recent, ANALYTICS_BACKFILL_INTERVAL
+
+# MongoDB connection (one shared, pooled client; see database.py)
+db = get_database()
+if db is None:
     print("⚠️ MongoDB not configured — running without DB")
-client = AsyncIOMotorClient(mongo_url)
-db_name = os.getenv("DB_NAME")
-
-if mongo_url and db_name:
-    db = client[db_name]
-else:
-    db = None
 # Create the main app
-app = FastAPI(title="Afro-Latino Marketplace API")
+app = FastAPI(title="Afro-Latino Marketplace API", default_response_class=FastJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -55,6 +69,12 @@ api_router = APIRouter(prefix="/api")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Stable sort keys for keyset pagination (each ends in a unique field and is
+# backed by an index declared in indexes.py)
+PRODUCT_SORT = [('created_at', -1), ('product_id', -1)]
+BLOG_POST_SORT = [('created_at', -1), ('post_id', -1)]
+ORDER_SORT = [('created_at', -1), ('order_id', -1)]
+
 # ==================== AUTH ROUTES ====================
 
 @api_router.post("/auth/register")
@@ -69,17 +89,17 @@ async def register(user_data: UserCreate):
     user = User(
         email=user_data.email,
         name=user_data.name,
-        password_hash=hash_password(user_data.password),
+        password_hash=await hash_password_async(user_data.password),
         auth_provider='email'
     )
     
     await db.users.insert_one(user.dict())
     
     # Create access token
-    token = create_access_token(user.user_id)
+    token = create_access_token(user.user_id, user)
     
     return {
-        'user': UserResponse(**user.dict()),
+        'user': UserResponse.from_user(user),
         'session_token': token
     }
 
@@ -94,11 +114,20 @@ async def login(credentials: UserLogin, response: Response):
     user = User(**user_doc)
     
     # Verify password
-    if not user.password_hash or not verify_password(credentials.password, user.password_hash):
+    if not user.password_hash or not await verify_password_async(credentials.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Upgrade the hash if the configured cost factor changed
+    if needs_rehash(user.password_hash):
+        user.password_hash = await hash_password_async(credentials.password)
+        await db.users.update_one(
+            {'user_id': user.user_id},
+            {'$set': {'password_hash': user.password_hash, 'updated_at': datetime.utcnow()}}
+        )
+        invalidate_user(user.user_id)
+    
     # Create access token
-    token = create_access_token(user.user_id)
+    token = create_access_token(user.user_id, user)
     
     # Set cookie
     response.set_cookie(
@@ -112,7 +141,7 @@ async def login(credentials: UserLogin, response: Response):
     )
     
     return {
-        'user': UserResponse(**user.dict()),
+        'user': UserResponse.from_user(user),
         'session_token': token
     }
 
@@ -122,8 +151,8 @@ async def get_me(
     session_token: Optional[str] = Cookie(None)
 ):
     """Get current authenticated user"""
-    user = await get_current_user(db, authorization, session_token)
-    return UserResponse(**user.dict())
+    user = await get_current_user(db, authorization, session_token, allow_claims=False)
+    return UserResponse.from_user(user)
 
 @api_router.post("/auth/logout")
 async def logout(response: Response):
@@ -135,6 +164,8 @@ async def logout(response: Response):
 
 @api_router.get("/products")
 async def get_products(
+    request: Request,
+    response: Response,
     culture: Optional[str] = None,
     category: Optional[str] = None,
     region: Optional[str] = None,
@@ -142,9 +173,21 @@ async def get_products(
     search: Optional[str] = None,
     featured: Optional[bool] = None,
     page: int = 1,
-    limit: int = 20
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    fields: Optional[str] = None,
+    facets: bool = False
 ):
-    """Get all products with filters"""
+    """
+    Get all products with filters.
+    Pass `cursor` (next_cursor/prev_cursor from a previous response) for
+    keyset pagination; `page` is kept for compatibility.
+    Pass include_total=false to skip counting, fields=a,b,c to select fields,
+    facets=true for per-value counts of every filter dimension.
+    """
+    limit = clamp_limit(limit)
+    selected = parse_fields(fields, Product)
     query = {}
     
     if culture:
@@ -157,36 +200,135 @@ async def get_products(
         query['country'] = {'$regex': country, '$options': 'i'}
     if featured is not None:
         query['featured'] = featured
-    if search:
-        query['$or'] = [
-            {'name': {'$regex': search, '$options': 'i'}},
-            {'description': {'$regex': search, '$options': 'i'}},
-            {'category': {'$regex': search, '$options': 'i'}},
-            {'country': {'$regex': search, '$options': 'i'}}
-        ]
-    
-    # Get total count
-    total = await db.products.count_documents(query)
+    # Sort keys and validators are always fetched, then trimmed if not selected
+    projection = build_projection(selected, internal=('product_id', 'created_at', 'updated_at'))
+    sort = None
+    text_search = build_text_search(search) if search else None
+    if search and text_search is None:
+        # Nothing searchable (e.g. only punctuation), so nothing can match
+        return json_response({
+            'products': [],
+            'total': 0 if include_total else None,
+            'page': None if cursor else page,
+            'pages': 0 if include_total else None,
+            'next_cursor': None,
+            'prev_cursor': None,
+            **({'facets': {field: [] for field in FACET_FIELDS}} if facets else {})
+        })
+    if text_search:
+        # Uses the weighted text index; results are ranked by relevance
+        query['$text'] = text_search
+        projection['score'] = {'$meta': 'textScore'}
+        sort = [('score', {'$meta': 'textScore'})]
+    
+    # Get total count (search totals aren't cacheable, filter combinations are)
+    total = None
+    if include_total:
+        key = None if text_search else product_filter_key(culture, category, region, country, featured)
+        total = await count_with_cache(db.products, query, product_totals, key)
     
     # Get paginated results
     skip = (page - 1) * limit
-    cursor = db.products.find(query, {'_id': 0}).skip(skip).limit(limit)
-    products = await cursor.to_list(length=limit)
+    next_cursor = prev_cursor = None
+    if sort:
+        # Relevance-ranked search results only support page numbers
+        if cursor:
+            raise HTTPException(status_code=400, detail="Cursor pagination is not supported with search")
+        products = await db.products.find(query, projection).sort(sort).skip(skip).limit(limit).to_list(length=limit)
+        # The relevance score is only needed for sorting
+        for product in products:
+            product.pop('score', None)
+    else:
+        result = await keyset_page(db.products, query, projection, PRODUCT_SORT, limit, cursor=cursor, skip=skip)
+        products = result['items']
+        next_cursor, prev_cursor = result['next_cursor'], result['prev_cursor']
     
-    return {
+    # One $facet aggregation for filtered queries, the materialized counts otherwise
+    facet_counts = await facets_for_query(db, query) if facets else None
+    
+    not_modified = apply_validators(
+        request, response, 'products',
+        make_etag('products', sorted(request.query_params.multi_items()), total,
+                  [(p.get('product_id'), p.get('updated_at')) for p in products], facet_counts)
+    )
+    if not_modified:
+        return not_modified
+    trim_documents(products, selected)
+    
+    return json_response({
         'products': products,
         'total': total,
-        'page': page,
-        'pages': (total + limit - 1) // limit
-    }
+        'page': None if cursor else page,
+        'pages': (total + limit - 1) // limit if total is not None else None,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        **({'facets': facet_counts} if facets else {})
+    }, headers=response.headers)
+
+# Bulk routes are declared before /products/{product_id} so they aren't captured by it
+
+@api_router.post("/products/import")
+async def import_products_bulk(
+    request: Request,
+    format: Optional[str] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Cookie(None)
+):
+    """
+    Bulk upsert products from an NDJSON or CSV request body (Admin only).
+    The format comes from `format` or the Content-Type; rows are keyed on
+    product_id and a per-row error report is returned.
+    """
+    await get_current_admin(db, authorization, session_token)
+    fmt = detect_format(request.headers.get('content-type'), format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson")
+    
+    report = await import_products(db, request.stream(), fmt, batch_size=max(1, min(batch_size, 5000)))
+    product_cache.clear()
+    product_totals.clear()
+    await invalidate(db, 'categories', 'products')
+    return report.dict()
+
+@api_router.get("/products/export")
+async def export_products_bulk(
+    format: str = 'ndjson',
+    category: Optional[str] = None,
+    culture: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Cookie(None)
+):
+    """Stream the catalog as NDJSON or CSV (Admin only)"""
+    await get_current_admin(db, authorization, session_token)
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    query = {}
+    if category:
+        query['category'] = category
+    if culture:
+        query['culture'] = culture
+    return StreamingResponse(
+        export_products(db, format, query, batch_size=clamp_batch_size(batch_size)),
+        media_type=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename="products.{format}"'}
+    )
 
 @api_router.get("/products/{product_id}")
-async def get_product(product_id: str):
+async def get_product(product_id: str, request: Request, response: Response):
     """Get single product by ID"""
     product = await db.products.find_one({'product_id': product_id}, {'_id': 0})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    not_modified = apply_validators(
+        request, response, 'product',
+        make_etag('product', product_id, product.get('updated_at')),
+        product.get('updated_at')
+    )
+    if not_modified:
+        return not_modified
+    return json_response(product, headers=response.headers)
 
 @api_router.post("/products")
 async def create_product(
@@ -198,15 +340,19 @@ async def create_product(
     await get_current_admin(db, authorization, session_token)
     
     new_product = Product(**product.dict())
-    await db.products.insert_one(new_product.dict())
+    if new_product.stock_quantity is not None:
+        new_product.in_stock = new_product.stock_quantity > 0
+    doc = new_product.dict()
+    await db.products.insert_one(doc)
+    doc.pop('_id', None)
     
-    # Update category count
-    await db.categories.update_one(
-        {'name': product.category},
-        {'$inc': {'product_count': 1}}
-    )
+    # Update facet and category counts
+    await apply_facet_changes(db, facet_changes(None, doc))
+    product_totals.apply_change(None, doc)
+    product_cache.invalidate(new_product.product_id)
+    await invalidate(db, 'categories', 'products', skip_local=('products',))
     
-    return new_product.dict()
+    return json_response(doc)
 
 @api_router.put("/products/{product_id}")
 async def update_product(
@@ -218,26 +364,24 @@ async def update_product(
     """Update product (Admin only)"""
     await get_current_admin(db, authorization, session_token)
     
-    # Get existing product
-    existing = await db.products.find_one({'product_id': product_id}, {'_id': 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
     # Update fields
     update_data = {k: v for k, v in product_update.dict().items() if v is not None}
+    if 'stock_quantity' in update_data:
+        update_data['in_stock'] = update_data['stock_quantity'] > 0
     update_data['updated_at'] = datetime.utcnow()
     
-    await db.products.update_one(
-        {'product_id': product_id},
-        {'$set': update_data}
-    )
-    
-    # If category changed, update counts
-    if 'category' in update_data and update_data['category'] != existing['category']:
-        await db.categories.update_one({'name': existing['category']}, {'$inc': {'product_count': -1}})
-        await db.categories.update_one({'name': update_data['category']}, {'$inc': {'product_count': 1}})
+    # One round trip: the previous version tells us what changed, the new
+    # version is the previous one with our $set applied
+    existing = await update_and_fetch(db.products, {'product_id': product_id}, update_data, before=True)
+    if not existing:
+        raise HTTPException(status_code=404, detail="Product not found")
+    updated = {**existing, **update_data}
     
-    updated = await db.products.find_one({'product_id': product_id}, {'_id': 0})
+    # Update facet and category counts for whatever changed
+    await apply_facet_changes(db, facet_changes(existing, updated))
+    product_totals.apply_change(existing, updated)
+    product_cache.invalidate(product_id)
+    await invalidate(db, 'categories', 'products', skip_local=('products',))
     return updated
 
 @api_router.delete("/products/{product_id}")
@@ -249,33 +393,39 @@ async def delete_product(
     """Delete product (Admin only)"""
     await get_current_admin(db, authorization, session_token)
     
-    product = await db.products.find_one({'product_id': product_id}, {'_id': 0})
+    product = await db.products.find_one_and_delete({'product_id': product_id}, projection={'_id': 0})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    await db.products.delete_one({'product_id': product_id})
-    
-    # Update category count
-    await db.categories.update_one(
-        {'name': product['category']},
-        {'$inc': {'product_count': -1}}
-    )
+    # Update facet and category counts
+    await apply_facet_changes(db, facet_changes(product, None))
+    product_totals.apply_change(product, None)
+    product_cache.invalidate(product_id)
+    await invalidate(db, 'categories', 'products', skip_local=('products',))
     
     return {"message": "Product deleted successfully"}
 
 # ==================== CATEGORY & REGION ROUTES ====================
 
 @api_router.get("/categories")
-async def get_categories():
+async def get_categories(request: Request, response: Response):
     """Get all categories"""
-    categories = await db.categories.find({}, {'_id': 0}).to_list(length=100)
-    return {'categories': categories}
+    async def load():
+        categories = await db.categories.find({}, {'_id': 0}).to_list(length=100)
+        payload = {'categories': categories}
+        return payload, content_etag(payload)
+    payload, etag = await reference_cache.get_or_load('categories', 'all', load)
+    return apply_validators(request, response, 'categories', etag) or json_response(payload, headers=response.headers)
 
 @api_router.get("/regions")
-async def get_regions():
+async def get_regions(request: Request, response: Response):
     """Get all regions"""
-    regions = await db.regions.find({}, {'_id': 0}).to_list(length=100)
-    return {'regions': regions}
+    async def load():
+        regions = await db.regions.find({}, {'_id': 0}).to_list(length=100)
+        payload = {'regions': regions}
+        return payload, content_etag(payload)
+    payload, etag = await reference_cache.get_or_load('regions', 'all', load)
+    return apply_validators(request, response, 'regions', etag) or json_response(payload, headers=response.headers)
 
 @api_router.post("/categories")
 async def create_category(
@@ -286,8 +436,11 @@ async def create_category(
     """Create category (Admin only)"""
     await get_current_admin(db, authorization, session_token)
     new_category = Category(**category.dict())
-    await db.categories.insert_one(new_category.dict())
-    return new_category.dict()
+    doc = new_category.dict()
+    await db.categories.insert_one(doc)
+    doc.pop('_id', None)
+    await invalidate(db, 'categories')
+    return json_response(doc)
 
 @api_router.delete("/categories/{category_id}")
 async def delete_category(
@@ -298,16 +451,21 @@ async def delete_category(
     """Delete category (Admin only)"""
     await get_current_admin(db, authorization, session_token)
     await db.categories.delete_one({'category_id': category_id})
+    await invalidate(db, 'categories')
     return {"message": "Category deleted"}
 
 # ==================== RECIPE ROUTES ====================
 
 @api_router.get("/recipes")
 async def get_recipes(
+    request: Request,
+    response: Response,
     culture: Optional[str] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    fields: Optional[str] = None
 ):
-    """Get all recipes with filters"""
+    """Get all recipes with filters (fields=a,b,c to select fields)"""
+    selected = parse_fields(fields, Recipe)
     query = {}
     if culture:
         query['culture'] = culture
@@ -317,8 +475,17 @@ async def get_recipes(
             {'description': {'$regex': search, '$options': 'i'}}
         ]
     
-    recipes = await db.recipes.find(query, {'_id': 0}).to_list(length=100)
-    return {'recipes': recipes}
+    projection = build_projection(selected, internal=('recipe_id', 'updated_at'))
+    recipes = await db.recipes.find(query, projection).to_list(length=100)
+    not_modified = apply_validators(
+        request, response, 'recipes',
+        make_etag('recipes', sorted(request.query_params.multi_items()),
+                  [(r.get('recipe_id'), r.get('updated_at')) for r in recipes])
+    )
+    if not_modified:
+        return not_modified
+    trim_documents(recipes, selected)
+    return json_response({'recipes': recipes}, headers=response.headers)
 
 @api_router.post("/recipes")
 async def create_recipe(
@@ -329,8 +496,10 @@ async def create_recipe(
     """Create recipe (Admin only)"""
     await get_current_admin(db, authorization, session_token)
     new_recipe = Recipe(**recipe.dict())
-    await db.recipes.insert_one(new_recipe.dict())
-    return new_recipe.dict()
+    doc = new_recipe.dict()
+    await db.recipes.insert_one(doc)
+    doc.pop('_id', None)
+    return json_response(doc)
 
 @api_router.delete("/recipes/{recipe_id}")
 async def delete_recipe(
@@ -348,8 +517,10 @@ async def delete_recipe(
 @api_router.get("/testimonials")
 async def get_testimonials():
     """Get all testimonials"""
-    testimonials = await db.testimonials.find({}, {'_id': 0}).to_list(length=100)
-    return {'testimonials': testimonials}
+    async def load():
+        testimonials = await db.testimonials.find({}, {'_id': 0}).to_list(length=100)
+        return {'testimonials': testimonials}
+    return json_response(await reference_cache.get_or_load('testimonials', 'all', load))
 
 # ==================== ORDER ROUTES ====================
 
@@ -368,8 +539,11 @@ async def create_order(
     except:
         pass  # Allow guest checkout
     
+    # Reprice every line from the catalog (one batched lookup) and reject stale carts
+    items = await reprice_cart(db, order_data.items)
+    
     # Calculate totals
-    subtotal = sum(item.price * item.quantity for item in order_data.items)
+    subtotal = round(sum(item.price * item.quantity for item in items), 2)
     
     # Calculate delivery fee ($10 for first 5km + $2/km additional)
     # Mock distance calculation
@@ -386,7 +560,7 @@ async def create_order(
     # Create order
     order = Order(
         user_id=user_id,
-        items=order_data.items,
+        items=items,
         delivery_info=order_data.delivery_info,
         subtotal=subtotal,
         delivery_fee=delivery_fee,
@@ -394,6 +568,9 @@ async def create_order(
         payment_method=order_data.payment_method
     )
     
+    # Hold stock until payment completes (released automatically if it doesn't)
+    order.reservation_id = await reserve_stock(db, order.order_id, items)
+    
     await db.orders.insert_one(order.dict())
     
     # Create payment URL based on method
@@ -412,13 +589,70 @@ async def create_order(
 
 @api_router.get("/orders")
 async def get_orders(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     authorization: Optional[str] = Header(None),
     session_token: Optional[str] = Cookie(None)
 ):
-    """Get user's orders"""
+    """Get user's orders, newest first (keyset pagination via `cursor`, fields=a,b,c to select fields)"""
+    selected = parse_fields(fields, Order)
     user = await get_current_user(db, authorization, session_token)
-    orders = await db.orders.find({'user_id': user.user_id}, {'_id': 0}).to_list(length=100)
-    return {'orders': orders}
+    projection = build_projection(selected, internal=('order_id', 'created_at'))
+    result = await keyset_page(
+        db.orders, {'user_id': user.user_id}, projection, ORDER_SORT, clamp_limit(limit), cursor=cursor
+    )
+    trim_documents(result['items'], selected)
+    return json_response({
+        'orders': result['items'],
+        'next_cursor': result['next_cursor'],
+        'prev_cursor': result['prev_cursor']
+    })
+
+# Admin exports are declared before /orders/{order_id} so they aren't captured by it
+
+@api_router.get("/orders/export")
+async def export_orders_bulk(
+    format: str = 'ndjson',
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    payment_status: Optional[str] = None,
+    order_status: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Cookie(None)
+):
+    """Stream orders as NDJSON or CSV, oldest first (Admin only)"""
+    await get_current_admin(db, authorization, session_token)
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    query = export_filter(created_from, created_to, payment_status=payment_status, order_status=order_status)
+    return StreamingResponse(
+        export_orders(db, format, query, clamp_batch_size(batch_size)),
+        media_type=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename="orders.{format}"'}
+    )
+
+@api_router.get("/payments/transactions/export")
+async def export_transactions_bulk(
+    format: str = 'ndjson',
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    payment_status: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Cookie(None)
+):
+    """Stream payment transactions as NDJSON or CSV, oldest first (Admin only)"""
+    await get_current_admin(db, authorization, session_token)
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    query = export_filter(created_from, created_to, payment_status=payment_status)
+    return StreamingResponse(
+        export_transactions(db, format, query, clamp_batch_size(batch_size)),
+        media_type=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename="payment_transactions.{format}"'}
+    )
 
 @api_router.get("/orders/{order_id}")
 async def get_order(
@@ -431,18 +665,10 @@ async def get_order(
     order = await db.orders.find_one({'order_id': order_id, 'user_id': user.user_id}, {'_id': 0})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+    return json_response(order)
 
 # ==================== PAYMENT ROUTES (STRIPE) ====================
 
-async def get_stripe_credentials():
-    """Get Stripe credentials from database"""
-    settings = await db.site_settings.find_one({'settings_id': 'site_settings'}, {'_id': 0})
-    if settings and settings.get('stripe_api_key'):
-        return settings['stripe_api_key']
-    # Fallback to environment variable
-    return os.getenv('STRIPE_API_KEY', 'sk_test_emergent')
-
 @api_router.get("/payments/stripe/checkout/{order_id}")
 async def stripe_checkout(order_id: str, request: Request):
     """Create Stripe checkout session"""
@@ -451,35 +677,29 @@ async def stripe_checkout(order_id: str, request: Request):
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    # Get Stripe API key
-    stripe_api_key = await get_stripe_credentials()
+    # The session must close before the stock hold does
+    expires_at = await hold_for_checkout(db, order_id)
     
     # Get host URL from request
     host_url = str(request.base_url).rstrip('/')
     
-    # Create Stripe checkout
-    stripe_checkout = StripeCheckout(
-        api_key=stripe_api_key,
-        webhook_url=f"{host_url}/api/payments/stripe/webhook"
-    )
-    
     # Prepare checkout request
     success_url = f"{host_url}/order-success?session_id={{CHECKOUT_SESSION_ID}}"
     cancel_url = f"{host_url}/checkout"
     
-    checkout_request = CheckoutSessionRequest(
+    session = await payment_gateway.create_checkout_session(
+        db,
         amount=float(order['total']),
         currency='cad',
         success_url=success_url,
         cancel_url=cancel_url,
         metadata={
             'order_id': order_id,
-            'user_id': order.get('user_id', 'guest')
-        }
+            'user_id': order.get('user_id') or 'guest'
+        },
+        expires_at=expires_at
     )
     
-    session = await stripe_checkout.create_checkout_session(checkout_request)
-    
     # Create payment transaction
     transaction = PaymentTransaction(
         order_id=order_id,
@@ -499,28 +719,28 @@ async def stripe_checkout(order_id: str, request: Request):
 
 @api_router.get("/payments/stripe/status/{session_id}")
 async def stripe_payment_status(session_id: str):
-    """Check Stripe payment status"""
-    stripe_api_key = await get_stripe_credentials()
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key)
-    status = await stripe_checkout.get_checkout_status(session_id)
-    
-    # Update transaction and order
-    transaction = await db.payment_transactions.find_one({'stripe_session_id': session_id}, {'_id': 0})
-    if transaction:
-        # Update transaction
-        await db.payment_transactions.update_one(
-            {'stripe_session_id': session_id},
-            {'$set': {'payment_status': status.payment_status, 'updated_at': datetime.utcnow()}}
-        )
-        
-        # Update order
-        if status.payment_status == 'paid':
-            await db.orders.update_one(
-                {'order_id': transaction['order_id']},
-                {'$set': {'payment_status': 'paid', 'order_status': 'processing', 'updated_at': datetime.utcnow()}}
-            )
-    
-    return status.dict()
+    """
+    Check Stripe payment status.
+    Reads the stored transaction only; webhooks and the background
+    reconciler keep it in sync with Stripe.
+    """
+    transaction = await db.payment_transactions.find_one(
+        {'stripe_session_id': session_id},
+        {'_id': 0, 'payment_status': 1, 'amount': 1, 'currency': 1, 'metadata': 1}
+    )
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Payment session not found")
+    
+    payment_status = transaction['payment_status']
+    checkout_status = {'paid': 'complete', 'expired': 'expired'}.get(payment_status, 'open')
+    return CheckoutStatus(
+        session_id=session_id,
+        status=checkout_status,
+        payment_status=payment_status,
+        amount_total=int(round(transaction['amount'] * 100)),
+        currency=transaction.get('currency'),
+        metadata=transaction.get('metadata') or {}
+    ).dict()
 
 @api_router.post("/payments/stripe/webhook")
 async def stripe_webhook(request: Request):
@@ -528,29 +748,12 @@ async def stripe_webhook(request: Request):
     body = await request.body()
     sig_header = request.headers.get('Stripe-Signature')
     
-    stripe_api_key = await get_stripe_credentials()
-    stripe_checkout = StripeCheckout(
-        api_key=stripe_api_key,
-        webhook_url=str(request.base_url) + "/api/payments/stripe/webhook"
-    )
+    event = await payment_gateway.parse_webhook(db, body, sig_header)
     
     try:
-        event = await stripe_checkout.handle_webhook(body, sig_header)
-        
         if event.event_type == 'checkout.session.completed':
-            # Update payment status
-            await db.payment_transactions.update_one(
-                {'stripe_session_id': event.session_id},
-                {'$set': {'payment_status': 'paid', 'updated_at': datetime.utcnow()}}
-            )
-            
-            # Update order
-            transaction = await db.payment_transactions.find_one({'stripe_session_id': event.session_id}, {'_id': 0})
-            if transaction:
-                await db.orders.update_one(
-                    {'order_id': transaction['order_id']},
-                    {'$set': {'payment_status': 'paid', 'order_status': 'processing', 'updated_at': datetime.utcnow()}}
-                )
+            # Update transaction and order once per Stripe event (retries are no-ops)
+            await apply_payment_status(db, event.session_id, event.payment_status or 'paid', event_id=event.event_id)
         
         return {"status": "success"}
     except Exception as e:
@@ -562,14 +765,16 @@ async def stripe_webhook(request: Request):
 @api_router.get("/settings")
 async def get_settings():
     """Get site settings"""
-    settings = await db.site_settings.find_one({'settings_id': 'site_settings'}, {'_id': 0})
-    if not settings:
-        # Create default settings
-        from models import SiteSettings
-        default_settings = SiteSettings()
-        await db.site_settings.insert_one(default_settings.dict())
-        return default_settings.dict()
-    return settings
+    async def load():
+        settings = await db.site_settings.find_one({'settings_id': 'site_settings'}, {'_id': 0})
+        if not settings:
+            # Create default settings
+            from models import SiteSettings
+            default_settings = SiteSettings()
+            await db.site_settings.insert_one(default_settings.dict())
+            return default_settings.dict()
+        return settings
+    return json_response(await reference_cache.get_or_load('settings', 'site_settings', load))
 
 @api_router.put("/settings")
 async def update_settings(
@@ -582,13 +787,10 @@ async def update_settings(
     
     settings_update['updated_at'] = datetime.utcnow()
     
-    await db.site_settings.update_one(
-        {'settings_id': 'site_settings'},
-        {'$set': settings_update},
-        upsert=True
+    updated_settings = await update_and_fetch(
+        db.site_settings, {'settings_id': 'site_settings'}, settings_update, upsert=True
     )
-    
-    updated_settings = await db.site_settings.find_one({'settings_id': 'site_settings'}, {'_id': 0})
+    await invalidate(db, 'settings')
     return updated_settings
 
 # ==================== HOLIDAY NOTICE ROUTES ====================
@@ -596,13 +798,16 @@ async def update_settings(
 @api_router.get("/notices")
 async def get_notices():
     """Get active notices"""
-    now = datetime.utcnow()
-    notices = await db.holiday_notices.find({
-        'is_active': True,
-        'start_date': {'$lte': now},
-        'end_date': {'$gte': now}
-    }, {'_id': 0}).to_list(length=10)
-    return {'notices': notices}
+    async def load():
+        now = datetime.utcnow()
+        notices = await db.holiday_notices.find({
+            'is_active': True,
+            'start_date': {'$lte': now},
+            'end_date': {'$gte': now}
+        }, {'_id': 0}).to_list(length=10)
+        return {'notices': notices}
+    # Short TTL also bounds how late a notice appears/disappears at its dates
+    return json_response(await reference_cache.get_or_load('notices', 'active', load))
 
 @api_router.get("/notices/all")
 async def get_all_notices(
@@ -625,8 +830,11 @@ async def create_notice(
     
     from models import HolidayNotice
     notice = HolidayNotice(**notice_data)
-    await db.holiday_notices.insert_one(notice.dict())
-    return notice.dict()
+    doc = notice.dict()
+    await db.holiday_notices.insert_one(doc)
+    doc.pop('_id', None)
+    await invalidate(db, 'notices')
+    return json_response(doc)
 
 @api_router.put("/notices/{notice_id}")
 async def update_notice(
@@ -640,12 +848,8 @@ async def update_notice(
     
     notice_update['updated_at'] = datetime.utcnow()
     
-    await db.holiday_notices.update_one(
-        {'notice_id': notice_id},
-        {'$set': notice_update}
-    )
-    
-    updated = await db.holiday_notices.find_one({'notice_id': notice_id}, {'_id': 0})
+    updated = await update_and_fetch(db.holiday_notices, {'notice_id': notice_id}, notice_update)
+    await invalidate(db, 'notices')
     return updated
 
 @api_router.delete("/notices/{notice_id}")
@@ -657,6 +861,7 @@ async def delete_notice(
     """Delete notice (Admin only)"""
     await get_current_admin(db, authorization, session_token)
     await db.holiday_notices.delete_one({'notice_id': notice_id})
+    await invalidate(db, 'notices')
     return {"message": "Notice deleted"}
 
 # ==================== BLOG ROUTES ====================
@@ -666,50 +871,68 @@ async def get_blog_posts(
     category: Optional[str] = None,
     published: bool = True,
     page: int = 1,
-    limit: int = 10
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
-    """Get blog posts"""
+    """Get blog posts (keyset pagination via `cursor`, `page` kept for compatibility)"""
+    limit = clamp_limit(limit)
     query = {'published': published} if published else {}
     if category:
         query['category'] = category
     
-    total = await db.blog_posts.count_documents(query)
+    total = None
+    if include_total:
+        total = await count_with_cache(db.blog_posts, query, blog_post_totals, (published, category))
     skip = (page - 1) * limit
     
-    posts = await db.blog_posts.find(query, {'_id': 0}).sort('created_at', -1).skip(skip).limit(limit).to_list(length=limit)
+    # List views only need title/excerpt/image, so leave the body behind
+    result = await keyset_page(db.blog_posts, query, BLOG_LIST_PROJECTION, BLOG_POST_SORT, limit, cursor=cursor, skip=skip)
+    for post in result['items']:
+        post['views'] = post.get('views', 0) + view_counter.pending(post['post_id'])
     
-    return {
-        'posts': posts,
+    return json_response({
+        'posts': result['items'],
         'total': total,
-        'page': page,
-        'pages': (total + limit - 1) // limit
-    }
+        'page': None if cursor else page,
+        'pages': (total + limit - 1) // limit if total is not None else None,
+        'next_cursor': result['next_cursor'],
+        'prev_cursor': result['prev_cursor']
+    })
 
 @api_router.get("/blog/{post_id}")
 async def get_blog_post(post_id: str):
     """Get single blog post"""
-    post = await db.blog_posts.find_one({'post_id': post_id}, {'_id': 0})
+    post = await blog_post_cache.get_post(db, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Increment views
-    await db.blog_posts.update_one({'post_id': post_id}, {'$inc': {'views': 1}})
-    post['views'] = post.get('views', 0) + 1
+    # Count the view (written in batches by the view counter)
+    post['views'] = post.get('views', 0) + view_counter.hit(db, post_id)
     
-    return post
+    return json_response(post)
 
 @api_router.get("/blog/slug/{slug}")
-async def get_blog_post_by_slug(slug: str):
+async def get_blog_post_by_slug(slug: str, request: Request, response: Response):
     """Get blog post by slug"""
-    post = await db.blog_posts.find_one({'slug': slug}, {'_id': 0})
+    post_id = await blog_post_cache.post_id_for_slug(db, slug)
+    post = await blog_post_cache.get_post(db, post_id) if post_id else None
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Increment views
-    await db.blog_posts.update_one({'slug': slug}, {'$inc': {'views': 1}})
-    post['views'] = post.get('views', 0) + 1
+    # Count the view (a revalidated page view still counts)
+    post['views'] = post.get('views', 0) + view_counter.hit(db, post['post_id'])
+    
+    # The weak ETag ignores the view counter so revalidation isn't defeated by it
+    not_modified = apply_validators(
+        request, response, 'blog_post',
+        make_etag('blog_post', post.get('post_id'), post.get('updated_at')),
+        post.get('updated_at')
+    )
+    if not_modified:
+        return not_modified
     
-    return post
+    return json_response(post, headers=response.headers)
 
 @api_router.post("/blog")
 async def create_blog_post(
@@ -727,9 +950,17 @@ async def create_blog_post(
     slug = re.sub(r'[^a-z0-9]+', '-', post_data['title'].lower()).strip('-')
     post_data['slug'] = slug
     
+    # Precompute the excerpt used by list views
+    if not post_data.get('excerpt'):
+        post_data['excerpt'] = make_excerpt(post_data.get('content', ''))
+    
     post = BlogPost(**post_data)
-    await db.blog_posts.insert_one(post.dict())
-    return post.dict()
+    doc = post.dict()
+    await db.blog_posts.insert_one(doc)
+    doc.pop('_id', None)
+    await invalidate(db, 'blog_posts')
+    await blog_post_cache.rebuild_slugs(db)
+    return json_response(doc)
 
 @api_router.put("/blog/{post_id}")
 async def update_blog_post(
@@ -749,12 +980,18 @@ async def update_blog_post(
         slug = re.sub(r'[^a-z0-9]+', '-', post_update['title'].lower()).strip('-')
         post_update['slug'] = slug
     
-    await db.blog_posts.update_one(
-        {'post_id': post_id},
-        {'$set': post_update}
-    )
-    
-    updated = await db.blog_posts.find_one({'post_id': post_id}, {'_id': 0})
+    # Keep the precomputed excerpt in step: regenerate it when the content
+    # changes without a new excerpt, or when it is cleared
+    if not post_update.get('excerpt') and ('content' in post_update or 'excerpt' in post_update):
+        content = post_update.get('content')
+        if content is None:
+            stored = await db.blog_posts.find_one({'post_id': post_id}, {'_id': 0, 'content': 1})
+            content = (stored or {}).get('content')
+        post_update['excerpt'] = make_excerpt(content or '')
+    
+    updated = await update_and_fetch(db.blog_posts, {'post_id': post_id}, post_update)
+    await invalidate(db, 'blog_posts')
+    await blog_post_cache.rebuild_slugs(db)
     return updated
 
 @api_router.delete("/blog/{post_id}")
@@ -766,6 +1003,7 @@ async def delete_blog_post(
     """Delete blog post (Admin only)"""
     await get_current_admin(db, authorization, session_token)
     await db.blog_posts.delete_one({'post_id': post_id})
+    await invalidate(db, 'blog_posts')
     return {"message": "Blog post deleted"}
 
 # ==================== ANNOUNCEMENTS ROUTES ====================
@@ -773,11 +1011,13 @@ async def delete_blog_post(
 @api_router.get("/announcements")
 async def get_announcements():
     """Get active announcements"""
-    announcements = await db.announcements.find(
-        {'is_active': True},
-        {'_id': 0}
-    ).sort('priority', -1).limit(5).to_list(length=5)
-    return {'announcements': announcements}
+    async def load():
+        announcements = await db.announcements.find(
+            {'is_active': True},
+            {'_id': 0}
+        ).sort('priority', -1).limit(5).to_list(length=5)
+        return {'announcements': announcements}
+    return json_response(await reference_cache.get_or_load('announcements', 'active', load))
 
 @api_router.get("/announcements/all")
 async def get_all_announcements(
@@ -800,8 +1040,11 @@ async def create_announcement(
     
     from models import Announcement
     announcement = Announcement(**announcement_data)
-    await db.announcements.insert_one(announcement.dict())
-    return announcement.dict()
+    doc = announcement.dict()
+    await db.announcements.insert_one(doc)
+    doc.pop('_id', None)
+    await invalidate(db, 'announcements')
+    return json_response(doc)
 
 @api_router.put("/announcements/{announcement_id}")
 async def update_announcement(
@@ -815,12 +1058,8 @@ async def update_announcement(
     
     announcement_update['updated_at'] = datetime.utcnow()
     
-    await db.announcements.update_one(
-        {'announcement_id': announcement_id},
-        {'$set': announcement_update}
-    )
-    
-    updated = await db.announcements.find_one({'announcement_id': announcement_id}, {'_id': 0})
+    updated = await update_and_fetch(db.announcements, {'announcement_id': announcement_id}, announcement_update)
+    await invalidate(db, 'announcements')
     return updated
 
 @api_router.delete("/announcements/{announcement_id}")
@@ -832,19 +1071,23 @@ async def delete_announcement(
     """Delete announcement (Admin only)"""
     await get_current_admin(db, authorization, session_token)
     await db.announcements.delete_one({'announcement_id': announcement_id})
+    await invalidate(db, 'announcements')
     return {"message": "Announcement deleted"}
 
 # ==================== USER ROUTES ====================
 
 @api_router.get("/users")
 async def get_users(
+    fields: Optional[str] = None,
     authorization: Optional[str] = Header(None),
     session_token: Optional[str] = Cookie(None)
 ):
-    """Get all users (Admin only)"""
+    """Get all users (Admin only, fields=a,b,c to select fields)"""
     await get_current_admin(db, authorization, session_token)
-    users = await db.users.find({}, {'_id': 0, 'password_hash': 0}).to_list(length=1000)
-    return {'users': users}
+    selected = parse_fields(fields, User, exclude=('password_hash',))
+    projection = build_projection(selected, default={'_id': 0, 'password_hash': 0})
+    users = await db.users.find({}, projection).to_list(length=1000)
+    return json_response({'users': users})
 
 @api_router.put("/users/{user_id}")
 async def update_user(
@@ -865,11 +1108,61 @@ async def update_user(
     update_data.pop('is_admin', None)
     update_data['updated_at'] = datetime.utcnow()
     
-    await db.users.update_one({'user_id': user_id}, {'$set': update_data})
-    
-    updated_user = await db.users.find_one({'user_id': user_id}, {'_id': 0, 'password_hash': 0})
+    updated_user = await update_and_fetch(
+        db.users, {'user_id': user_id}, update_data, projection={'_id': 0, 'password_hash': 0}
+    )
+    invalidate_user(user_id)
+    await invalidate(db, 'users', local=False)
     return updated_user
 
+# ==================== ANALYTICS ROUTES ====================
+
+# Longest range a single dashboard query may span, per granularity
+ANALYTICS_MAX_RANGE = {'hour': timedelta(days=31), 'day': timedelta(days=731)}
+
+@api_router.get("/analytics/sales")
+async def get_sales_analytics(
+    granularity: str = 'day',
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    top: int = 10,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Cookie(None)
+):
+    """
+    Sales dashboard (Admin only): revenue, orders and units per bucket plus
+    breakdowns by culture, category and top products, read from the
+    precomputed rollups. Defaults to the last 7 days (day) or 24 hours (hour).
+    """
+    await get_current_admin(db, authorization, session_token)
+    if granularity not in ANALYTICS_MAX_RANGE:
+        raise HTTPException(status_code=400, detail="granularity must be hour or day")
+    # Rollup buckets are naive UTC
+    if start is not None and start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if end is not None and end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    end = end or datetime.utcnow()
+    start = start or end - (timedelta(days=7) if granularity == 'day' else timedelta(hours=24))
+    if start >= end or end - start > ANALYTICS_MAX_RANGE[granularity]:
+        raise HTTPException(status_code=400, detail="Invalid or too large date range")
+    return json_response(await sales_summary(db, granularity, start, end, top=max(1, min(top, 100))))
+
+# ==================== METRICS ====================
+
+# Optional bearer token required to scrape /metrics
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+register_stats('password_hash_jobs', 'bcrypt worker pool state', 'state', lambda: password_hash_stats)
+register_stats('response_compression', 'Response compression outcomes', 'outcome', lambda: compression_stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus metrics for this worker process"""
+    if METRICS_TOKEN and authorization != f'Bearer {METRICS_TOKEN}':
+        raise HTTPException(status_code=401, detail='Not authenticated')
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4')
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -882,6 +1175,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for large JSON bodies (see compression.py)
+app.add_middleware(CompressionMiddleware)
+
+# Outermost, so latency includes compression (see metrics.py)
+app.add_middleware(MetricsMiddleware)
+
+cache_sync_task = PeriodicTask('cache-sync', CACHE_SYNC_INTERVAL, lambda: invalidation_bus.poll(db))
+reservation_sweep_task = PeriodicTask(
+    'reservation-sweep', RESERVATION_SWEEP_INTERVAL, lambda: release_expired_reservations(db)
+)
+outbox_task = PeriodicTask('outbox', OUTBOX_POLL_INTERVAL, lambda: drain_outbox(db))
+reconcile_task = PeriodicTask('payment-reconciler', RECONCILE_INTERVAL, lambda: reconcile_pending_payments(db))
+view_flush_task = PeriodicTask('view-counter-flush', VIEW_FLUSH_INTERVAL, lambda: view_counter.flush(db))
+analytics_task = PeriodicTask('analytics-backfill', ANALYTICS_BACKFILL_INTERVAL, lambda: backfill_recent(db))
+facet_repair_task = PeriodicTask('facet-repair', FACET_REPAIR_INTERVAL, lambda: verify_facets(db, repair=True))
+
+@app.on_event("startup")
+async def startup():
+    if db is not None:
+        await connect()
+        await ensure_indexes(db)
+        await invalidation_bus.poll(db)
+        cache_sync_task.start()
+        reservation_sweep_task.start()
+        outbox_task.start()
+        reconcile_task.start()
+        view_flush_task.start()
+        analytics_task.start()
+        facet_repair_task.start()
+
 @app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+async def shutdown():
+    # Stop background work first so nothing touches the pool while it drains
+    await cache_sync_task.stop()
+    await reservation_sweep_task.stop()
+    await outbox_task.stop()
+    await reconcile_task.stop()
+    await view_flush_task.stop()
+    await analytics_task.stop()
+    await facet_repair_task.stop()
+    if db is not None:
+        await view_counter.close(db)
+    await payment_gateway.close()
+    shutdown_password_pool()
+    await disconnect()
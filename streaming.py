@@ -0,0 +1,67 @@
+"""
+Streaming NDJSON/CSV exports.
+
+stream_documents() walks a Motor cursor batch by batch and yields one
+encoded chunk per batch, so memory stays flat however many documents match.
+CSV columns may be dotted paths into subdocuments (e.g.
+'delivery_info.email'); lists of scalars are '|'-joined and any other
+nested value is written as JSON.
+"""
+import csv
+import io
+import os
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence
+import orjson
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+MAX_EXPORT_BATCH_SIZE = 5000
+
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+LIST_SEPARATOR = '|'
+
+def clamp_batch_size(batch_size: Optional[int]) -> int:
+    return max(1, min(batch_size or EXPORT_BATCH_SIZE, MAX_EXPORT_BATCH_SIZE))
+
+def csv_line(values: Sequence) -> bytes:
+    out = io.StringIO()
+    csv.writer(out, lineterminator='\n').writerow(values)
+    return out.getvalue().encode('utf-8')
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list) and not any(isinstance(v, (dict, list)) for v in value):
+        return LIST_SEPARATOR.join(str(v) for v in value)
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value).decode('utf-8')
+    return value
+
+def _lookup(doc: dict, path: str):
+    value = doc
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+async def stream_documents(cursor, fmt: str, columns: Optional[List[str]] = None, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Encode a cursor as NDJSON (whole documents) or CSV (`columns`), one chunk per batch"""
+    cursor = cursor.batch_size(batch_size)
+    if fmt == 'csv':
+        yield csv_line(columns)
+    chunk: List[bytes] = []
+    async for doc in cursor:
+        if fmt == 'csv':
+            chunk.append(csv_line([csv_value(_lookup(doc, column)) for column in columns]))
+        else:
+            chunk.append(orjson.dumps(doc) + b'\n')
+        if len(chunk) >= batch_size:
+            yield b''.join(chunk)
+            chunk = []
+    if chunk:
+        yield b''.join(chunk)
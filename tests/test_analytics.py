@@ -0,0 +1,14 @@
+from analytics import _order_increments
+
+def test_unit_counters_stay_integers():
+    inc = _order_increments({
+        'total': 25.5, 'subtotal': 20.5, 'delivery_fee': 5.0,
+        'items': [
+            {'product_id': 'prod_1', 'category': 'Spices', 'culture': 'African', 'price': 4.25, 'quantity': 2},
+            {'product_id': 'prod_2', 'category': 'Spices', 'culture': 'Latino', 'price': 12.0, 'quantity': 1}
+        ]
+    })
+    # Rebuilt buckets store integer units; the live $inc must match them
+    assert inc['units'] == 3 and isinstance(inc['units'], int)
+    assert isinstance(inc['categories.Spices.units'], int)
+    assert inc['categories.Spices.revenue'] == 20.5
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+import auth
+from models import User
+
+class _Collection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    async def find_one(self, query, projection=None):
+        for doc in self.docs:
+            if all(doc.get(k) == v for k, v in query.items()):
+                return dict(doc)
+        return None
+
+class _Database:
+    def __init__(self, users=()):
+        self.users = _Collection(users)
+        self.user_sessions = _Collection()
+
+@pytest.fixture
+def embedded_claims(monkeypatch):
+    monkeypatch.setattr(auth, 'JWT_EMBED_CLAIMS', True)
+    auth.invalidate_user('user_claims')
+
+def test_login_token_with_claims_authenticates(embedded_claims):
+    user = User(user_id='user_claims', email='a@b.co', name='Al', is_admin=True)
+    token = auth.create_access_token(user.user_id, user)
+    # Claims make the JWT as long as a Google session token
+    assert len(token) > 200
+
+    # No users/sessions in the database: the claims alone must authenticate
+    current = asyncio.run(auth.get_current_user(_Database(), f'Bearer {token}', None))
+    assert current.user_id == 'user_claims'
+    assert current.is_admin
+
+def test_token_with_claims_falls_back_to_user_lookup(embedded_claims):
+    user = User(user_id='user_claims', email='a@b.co', name='Al')
+    token = auth.create_access_token(user.user_id, user)
+    db = _Database(users=[user.dict()])
+    current = asyncio.run(auth.get_current_user(db, None, token, allow_claims=False))
+    assert current.email == 'a@b.co'
+
+def test_opaque_session_token_is_not_a_jwt():
+    assert not auth.is_jwt('x' * 250)
+    assert auth.is_jwt(auth.create_access_token('user_1'))
@@ -0,0 +1,53 @@
+import pytest
+from fastapi.testclient import TestClient
+from pymongo import ReturnDocument
+import server
+
+class _Posts:
+    def __init__(self, *docs):
+        self.docs = {doc['post_id']: dict(doc) for doc in docs}
+
+    async def find_one(self, query, projection=None):
+        doc = self.docs.get(query['post_id'])
+        return dict(doc) if doc else None
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        doc = self.docs.get(query['post_id'])
+        if doc is None:
+            return None
+        doc.update(update['$set'])
+        return {k: v for k, v in doc.items() if k != '_id'} if return_document == ReturnDocument.AFTER else None
+
+class _Database:
+    def __init__(self, *posts):
+        self.blog_posts = _Posts(*posts)
+
+@pytest.fixture
+def client(monkeypatch):
+    async def admin(*args):
+        return None
+
+    async def noop(*args, **kwargs):
+        return None
+
+    db = _Database({'post_id': 'post_1', 'content': 'Original body', 'excerpt': 'Original body'})
+    monkeypatch.setattr(server, 'db', db)
+    monkeypatch.setattr(server, 'get_current_admin', admin)
+    monkeypatch.setattr(server, 'invalidate', noop)
+    monkeypatch.setattr(server.blog_post_cache, 'rebuild_slugs', noop)
+    return TestClient(server.app), db
+
+def test_editing_content_regenerates_excerpt(client):
+    http, db = client
+    assert http.put('/api/blog/post_1', json={'content': '<p>New body</p>'}).status_code == 200
+    assert db.blog_posts.docs['post_1']['excerpt'] == 'New body'
+
+def test_clearing_excerpt_rebuilds_it_from_stored_content(client):
+    http, db = client
+    assert http.put('/api/blog/post_1', json={'excerpt': ''}).status_code == 200
+    assert db.blog_posts.docs['post_1']['excerpt'] == 'Original body'
+
+def test_supplied_excerpt_is_kept(client):
+    http, db = client
+    http.put('/api/blog/post_1', json={'content': 'New body', 'excerpt': 'Hand written'})
+    assert db.blog_posts.docs['post_1']['excerpt'] == 'Hand written'
@@ -0,0 +1,58 @@
+import asyncio
+from cache import InvalidationBus
+
+class _Versions:
+    def __init__(self):
+        self.docs = {}
+        self.writes = 0
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        self.writes += 1
+        doc = self.docs.setdefault(query['_id'], {'_id': query['_id']})
+        for field, delta in update['$inc'].items():
+            doc[field] = doc.get(field, 0) + delta
+        return dict(doc)
+
+    async def find_one(self, query):
+        doc = self.docs.get(query['_id'])
+        return dict(doc) if doc else None
+
+class _Database:
+    def __init__(self):
+        self.cache_versions = _Versions()
+
+def test_publish_bumps_all_namespaces_in_one_write():
+    db = _Database()
+    writer, reader = InvalidationBus(), InvalidationBus()
+    cleared = {'writer': [], 'reader': []}
+    for namespace in ('categories', 'products'):
+        writer.subscribe(namespace, lambda ns=namespace: cleared['writer'].append(ns))
+        reader.subscribe(namespace, lambda ns=namespace: cleared['reader'].append(ns))
+
+    async def scenario():
+        await reader.poll(db)
+        await writer.publish(db, ['categories', 'products'], skip_local=['products'])
+        await reader.poll(db)
+        # The writer already knows the versions it published
+        await writer.poll(db)
+
+    asyncio.run(scenario())
+    assert db.cache_versions.writes == 1
+    assert cleared['writer'] == ['categories']
+    assert sorted(cleared['reader']) == ['categories', 'products']
+
+def test_skip_local_still_applies_other_workers_invalidations():
+    db = _Database()
+    first, second = InvalidationBus(), InvalidationBus()
+    cleared = []
+    second.subscribe('products', lambda: cleared.append('products'))
+
+    async def scenario():
+        await second.publish(db, ['products'])
+        cleared.clear()
+        # Another worker invalidates products before `second` polls again
+        await first.publish(db, ['products'])
+        await second.publish(db, ['products'], skip_local=['products'])
+
+    asyncio.run(scenario())
+    assert cleared == ['products']
@@ -0,0 +1,55 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from catalog_io import import_products
+
+class _Collection:
+    def __init__(self):
+        self.writes = []
+
+    async def _no_documents(self):
+        for doc in ():
+            yield doc
+
+    def find(self, query, projection=None):
+        return self._no_documents()
+
+    async def bulk_write(self, requests, ordered=True):
+        self.writes.append(list(requests))
+        # Every upsert inserts a new product
+        return SimpleNamespace(upserted_count=len(requests), matched_count=0)
+
+class _Database:
+    def __init__(self):
+        self.products = _Collection()
+        self.facet_counts = _Collection()
+        self.categories = _Collection()
+
+async def _chunks(*lines: bytes):
+    for line in lines:
+        yield line + b'\n'
+
+def _row(**fields) -> bytes:
+    row = {
+        'name': 'Jollof spice', 'price': 4.5, 'image': 'x.jpg', 'category': 'Spices',
+        'culture': 'African', 'country': 'Ghana', 'region': 'West Africa', 'description': 'Blend', **fields
+    }
+    return json.dumps(row).encode()
+
+def test_rows_without_product_id_are_rejected():
+    db = _Database()
+    report = asyncio.run(import_products(db, _chunks(_row()), 'ndjson'))
+    assert report.received == 1
+    assert report.failed == 1
+    assert report.errors == [{'row': 1, 'product_id': None, 'errors': ['Missing product_id']}]
+    assert db.products.writes == []
+
+def test_superseded_rows_are_not_failures():
+    db = _Database()
+    chunks = _chunks(_row(product_id='prod_1'), _row(product_id='prod_2'), _row(product_id='prod_1', price=5.0))
+    report = asyncio.run(import_products(db, chunks, 'ndjson'))
+    assert report.received == 3
+    assert (report.inserted, report.updated, report.failed, report.superseded) == (2, 0, 0, 1)
+    assert report.received == report.inserted + report.updated + report.failed + report.superseded
+    assert report.superseded_rows == [{'row': 1, 'product_id': 'prod_1', 'superseded_by': 3}]
+    assert report.errors == []
@@ -0,0 +1,26 @@
+from datetime import datetime
+from fastapi import Response
+from starlette.requests import Request
+from http_cache import apply_validators, make_etag
+
+def _request(**headers) -> Request:
+    raw = [(name.replace('_', '-').encode(), value.encode()) for name, value in headers.items()]
+    return Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': raw})
+
+def test_list_validates_on_etag_only():
+    response = Response()
+    etag = make_etag('products', ['prod_1'])
+    not_modified = apply_validators(
+        _request(if_modified_since='Wed, 01 Jan 2099 00:00:00 GMT'), response, 'products', etag
+    )
+    # A list can shrink without any updated_at moving; If-Modified-Since can't prove it's fresh
+    assert not_modified is None
+    assert 'last-modified' not in response.headers
+    assert apply_validators(_request(if_none_match=etag), Response(), 'products', etag).status_code == 304
+
+def test_document_honours_if_modified_since():
+    not_modified = apply_validators(
+        _request(if_modified_since='Wed, 01 Jan 2099 00:00:00 GMT'), Response(), 'product',
+        make_etag('product', 'prod_1'), datetime(2024, 5, 1)
+    )
+    assert not_modified.status_code == 304
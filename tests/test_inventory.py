@@ -0,0 +1,82 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorClient
+from inventory import reserve_stock, hold_for_checkout, CHECKOUT_SESSION_MINUTES
+from models import OrderItem
+
+MONGO_URL = os.getenv('MONGO_URL')
+
+needs_mongo = pytest.mark.skipif(not MONGO_URL, reason='needs a MongoDB server (set MONGO_URL)')
+
+async def _reserve_burst(initial: int, checkouts: int) -> dict:
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f'test_inventory_{uuid.uuid4().hex[:8]}']
+    try:
+        await db.products.insert_one({'product_id': 'hot', 'stock_quantity': initial, 'in_stock': True})
+        item = OrderItem(product_id='hot', name='Hot', price=1.0, quantity=1, image='')
+
+        async def checkout(n):
+            try:
+                return await reserve_stock(db, f'order_{n}', [item])
+            except HTTPException as e:
+                assert e.status_code == 409
+                return None
+
+        results = await asyncio.gather(*(checkout(n) for n in range(checkouts)))
+        product = await db.products.find_one({'product_id': 'hot'})
+        return {
+            'reserved': sum(1 for r in results if r),
+            'reservations': await db.stock_reservations.count_documents({}),
+            'product': product
+        }
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+@needs_mongo
+def test_concurrent_reservations_never_oversell():
+    initial, checkouts = 25, 200
+    outcome = asyncio.run(_reserve_burst(initial, checkouts))
+    product = outcome['product']
+    assert product['stock_quantity'] == 0
+    assert product['in_stock'] is False
+    assert 'updated_at' in product
+    assert outcome['reserved'] == initial
+    assert outcome['reservations'] == initial
+
+class _Reservations:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def _match(self, query):
+        return [doc for doc in self.docs if all(doc.get(k) == v for k, v in query.items())]
+
+    async def find_one_and_update(self, query, update, projection=None):
+        for doc in self._match(query):
+            doc['expires_at'] = max(doc['expires_at'], update['$max']['expires_at'])
+            return {'status': doc['status']}
+        return None
+
+    async def count_documents(self, query, limit=0):
+        return len(self._match(query))
+
+class _Database:
+    def __init__(self, *reservations):
+        self.stock_reservations = _Reservations(list(reservations))
+
+def test_checkout_hold_outlives_the_session():
+    reservation = {'order_id': 'order_1', 'status': 'pending', 'expires_at': datetime.utcnow()}
+    session_expires_at = asyncio.run(hold_for_checkout(_Database(reservation), 'order_1'))
+    assert session_expires_at > datetime.utcnow() + timedelta(minutes=30)
+    assert CHECKOUT_SESSION_MINUTES >= 31
+    assert reservation['expires_at'] > session_expires_at
+
+def test_released_reservation_cannot_be_checked_out():
+    reservation = {'order_id': 'order_1', 'status': 'released', 'expires_at': datetime.utcnow()}
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(hold_for_checkout(_Database(reservation), 'order_1'))
+    assert e.value.status_code == 409
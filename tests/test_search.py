@@ -0,0 +1,16 @@
+from fastapi.testclient import TestClient
+from search import build_text_search
+import server
+
+def test_build_text_search_folds_and_strips_operators():
+    assert build_text_search('Café "jollof" -rice') == {'$search': 'cafe jollof rice'}
+    assert build_text_search('?!-"') is None
+
+def test_punctuation_only_search_matches_nothing():
+    # Returns before touching the database, so no server is needed
+    response = TestClient(server.app).get('/api/products', params={'search': '?!', 'facets': 'true'})
+    assert response.status_code == 200
+    body = response.json()
+    assert body['products'] == []
+    assert body['total'] == 0
+    assert body['facets']['category'] == []
@@ -0,0 +1,34 @@
+import asyncio
+from pymongo import UpdateOne
+from view_counter import ViewCounter
+
+class _SlowPosts:
+    def __init__(self):
+        self.batches = []
+
+    async def bulk_write(self, requests, ordered=True):
+        await asyncio.sleep(0.01)
+        self.batches.append(list(requests))
+
+class _Database:
+    def __init__(self):
+        self.blog_posts = _SlowPosts()
+
+def _inc(post_id: str, views: int) -> UpdateOne:
+    return UpdateOne({'post_id': post_id}, {'$inc': {'views': views}})
+
+def test_close_waits_for_in_flight_flush():
+    async def scenario():
+        db = _Database()
+        counter = ViewCounter(flush_threshold=3)
+        for _ in range(3):
+            counter.hit(db, 'post_a')
+        await asyncio.sleep(0)
+        # The threshold flush is now in flight; this hit goes to the next batch
+        counter.hit(db, 'post_b')
+        await counter.close(db)
+        return db, counter
+
+    db, counter = asyncio.run(scenario())
+    assert db.blog_posts.batches == [[_inc('post_a', 3)], [_inc('post_b', 1)]]
+    assert counter.pending('post_a') == counter.pending('post_b') == 0
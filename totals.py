@@ -0,0 +1,102 @@
+"""
+Cheap listing totals.
+
+Counts for common filter combinations are cached for a short TTL and kept
+accurate in between by applying +/-1 deltas on product writes. Unfiltered
+totals come from collection metadata (estimated_document_count).
+"""
+import os
+import re
+from typing import Optional
+from cachetools import TTLCache
+from cache import invalidation_bus
+
+TOTALS_CACHE_TTL = int(os.getenv('TOTALS_CACHE_TTL', '60'))
+TOTALS_CACHE_SIZE = int(os.getenv('TOTALS_CACHE_SIZE', '512'))
+
+def product_filter_key(
+    culture: Optional[str] = None,
+    category: Optional[str] = None,
+    region: Optional[str] = None,
+    country: Optional[str] = None,
+    featured: Optional[bool] = None
+) -> tuple:
+    """Normalized cache key for a product filter combination"""
+    return (culture, category, region, country, featured)
+
+def _regex_matches(pattern: Optional[str], value) -> bool:
+    if pattern is None:
+        return True
+    return isinstance(value, str) and re.search(pattern, value, re.IGNORECASE) is not None
+
+def product_matches(key: tuple, product: Optional[dict]) -> bool:
+    """Evaluate a product filter key against a product document, mirroring get_products"""
+    if product is None:
+        return False
+    culture, category, region, country, featured = key
+    if culture is not None and product.get('culture') not in (culture, 'Fusion'):
+        return False
+    if featured is not None and product.get('featured') != featured:
+        return False
+    return (
+        _regex_matches(category, product.get('category'))
+        and _regex_matches(region, product.get('region'))
+        and _regex_matches(country, product.get('country'))
+    )
+
+class CountCache:
+    """TTL-bounded cache of totals keyed by filter combination"""
+
+    def __init__(self, matcher=None, maxsize: int = TOTALS_CACHE_SIZE, ttl: int = TOTALS_CACHE_TTL):
+        # Values are one-element lists so deltas don't reset the entry's TTL
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._matcher = matcher
+
+    def get(self, key) -> Optional[int]:
+        entry = self._cache.get(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, total: int):
+        self._cache[key] = [total]
+
+    def clear(self):
+        self._cache.clear()
+
+    def apply_change(self, before: Optional[dict], after: Optional[dict]):
+        """Adjust cached totals for a document that was created, updated or deleted"""
+        if self._matcher is None:
+            self.clear()
+            return
+        for key in list(self._cache.keys()):
+            try:
+                delta = int(self._matcher(key, after)) - int(self._matcher(key, before))
+            except re.error:
+                self._cache.pop(key, None)
+                continue
+            entry = self._cache.get(key)
+            if delta and entry is not None:
+                entry[0] = max(entry[0] + delta, 0)
+
+product_totals = CountCache(matcher=product_matches)
+blog_post_totals = CountCache()
+
+# Writes on other workers can't be replayed as deltas, so drop our copy
+invalidation_bus.subscribe('products', product_totals.clear)
+invalidation_bus.subscribe('blog_posts', blog_post_totals.clear)
+
+async def count_with_cache(collection, query: dict, cache: CountCache, key) -> int:
+    """
+    Total for a listing query. Unfiltered queries use the collection's
+    metadata count; filtered ones are cached under `key` (pass None to
+    bypass the cache, e.g. for free-text search).
+    """
+    if not query:
+        return await collection.estimated_document_count()
+    if key is not None:
+        total = cache.get(key)
+        if total is not None:
+            return total
+    total = await collection.count_documents(query)
+    if key is not None:
+        cache.set(key, total)
+    return total
@@ -0,0 +1,68 @@
+"""
+Write-behind blog view counters.
+
+Page views are counted in memory and written with one bulk_write every
+VIEW_FLUSH_INTERVAL seconds, or sooner once VIEW_FLUSH_THRESHOLD hits are
+pending, instead of one $inc per view. Pending hits are added to the stored
+count on reads, and flushed on graceful shutdown.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from typing import Optional
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+VIEW_FLUSH_INTERVAL = float(os.getenv('VIEW_FLUSH_INTERVAL', '5'))
+VIEW_FLUSH_THRESHOLD = int(os.getenv('VIEW_FLUSH_THRESHOLD', '1000'))
+
+class ViewCounter:
+    """Aggregates view increments per post between flushes"""
+
+    def __init__(self, flush_threshold: int = VIEW_FLUSH_THRESHOLD):
+        self.flush_threshold = flush_threshold
+        self._pending = Counter()
+        self._total = 0
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def hit(self, db, post_id: str) -> int:
+        """Count a view; returns the views for this post not yet written"""
+        self._pending[post_id] += 1
+        self._total += 1
+        if self._total >= self.flush_threshold and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush(db))
+        return self._pending[post_id]
+
+    def pending(self, post_id: str) -> int:
+        return self._pending.get(post_id, 0)
+
+    async def flush(self, db) -> int:
+        """Write all pending increments in one bulk_write"""
+        if not self._pending:
+            return 0
+        # Swap before awaiting so hits arriving mid-flush go to the next batch
+        batch, self._pending, self._total = self._pending, Counter(), 0
+        try:
+            await db.blog_posts.bulk_write(
+                [UpdateOne({'post_id': post_id}, {'$inc': {'views': n}}) for post_id, n in batch.items()],
+                ordered=False
+            )
+        except Exception as e:
+            # Keep the counts for the next flush rather than losing them
+            self._pending.update(batch)
+            self._total += sum(batch.values())
+            logger.error(f"View counter flush failed: {e}")
+            return 0
+        return len(batch)
+
+    async def close(self, db) -> int:
+        """Final flush on shutdown, after any threshold flush still in flight"""
+        if self._flush_task is not None and not self._flush_task.done():
+            # A failed in-flight flush puts its batch back in _pending for the flush below
+            await self._flush_task
+        self._flush_task = None
+        return await self.flush(db)
+
+view_counter = ViewCounter()